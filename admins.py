@@ -0,0 +1,57 @@
+import asyncio
+from collections import OrderedDict
+from time import monotonic
+from typing import Callable, Dict, FrozenSet, Optional, Tuple
+from aiogram import Bot
+from aiogram.enums import ChatMemberStatus
+
+ADMIN_STATUSES = (ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR)
+
+class AdminCache:
+    # состав админов по чатам: TTL + LRU, параллельные запросы одного чата объединяются
+    def __init__(self, ttl: float = 300, max_chats: int = 4096,
+                 on_roster: Optional[Callable[[int, FrozenSet[int]], None]] = None):
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self.on_roster = on_roster
+        self._entries: "OrderedDict[int, Tuple[float, FrozenSet[int]]]" = OrderedDict()
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    def _store(self, chat_id: int, admins: FrozenSet[int]):
+        self._entries[chat_id] = (monotonic() + self.ttl, admins)
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_chats:
+            self._entries.popitem(last=False)
+
+    async def _fetch(self, bot: Bot, chat_id: int) -> FrozenSet[int]:
+        members = await bot.get_chat_administrators(chat_id)
+        admins = frozenset(member.user.id for member in members)
+        self._store(chat_id, admins)
+        if self.on_roster:
+            self.on_roster(chat_id, admins)
+        return admins
+
+    async def get(self, bot: Bot, chat_id: int) -> FrozenSet[int]:
+        entry = self._entries.get(chat_id)
+        if entry and entry[0] > monotonic():
+            self._entries.move_to_end(chat_id)
+            return entry[1]
+        future = self._pending.get(chat_id)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(bot, chat_id))
+            self._pending[chat_id] = future
+            future.add_done_callback(lambda f: self._pending.pop(chat_id, None) if self._pending.get(chat_id) is f else None)
+        return await asyncio.shield(future)
+
+    async def is_admin(self, bot: Bot, chat_id: int, user_id: int) -> bool:
+        return user_id in await self.get(bot, chat_id)
+
+    def update_member(self, chat_id: int, user_id: int, is_admin: bool):
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return
+        admins = entry[1] | {user_id} if is_admin else entry[1] - {user_id}
+        self._entries[chat_id] = (entry[0], admins)
+
+    def invalidate(self, chat_id: int):
+        self._entries.pop(chat_id, None)
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from time import monotonic
+from typing import Awaitable, Callable, Dict, List, Tuple
+from aiogram.types import Message
+
+ALBUM_WINDOW = 0.5
+ALBUM_LIMIT = 10  # больше частей в одном альбоме Telegram не присылает
+
+AlbumCallback = Callable[[List[Message]], Awaitable[None]]
+
+class AlbumCollector:
+    # копит части альбома по media_group_id и отдаёт их одним списком, когда поток частей стих
+    def __init__(self, window: float = ALBUM_WINDOW):
+        self.window = window
+        self._parts: Dict[Tuple[int, str], List[Message]] = {}
+        self._seen: Dict[Tuple[int, str], float] = {}
+        self._callbacks: Dict[Tuple[int, str], AlbumCallback] = {}
+        self._timers: Dict[Tuple[int, str], asyncio.Task] = {}
+        self._running = set()
+
+    def collecting(self, message: Message) -> bool: #часть уже начатого альбома
+        return message.media_group_id is not None and (message.chat.id, message.media_group_id) in self._parts
+
+    def add(self, message: Message, callback: AlbumCallback):
+        # не ждёт окна: иначе остальные части альбома стояли бы в очереди чата за первой
+        key = (message.chat.id, message.media_group_id)
+        parts = self._parts.setdefault(key, [])
+        parts.append(message)
+        self._seen[key] = monotonic()
+        self._callbacks.setdefault(key, callback)
+        if len(parts) >= ALBUM_LIMIT:
+            timer = self._timers.pop(key, None)
+            if timer:
+                timer.cancel()
+            self._spawn(self._flush(key))
+        elif key not in self._timers:
+            self._timers[key] = self._spawn(self._flush_later(key))
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        return task
+
+    async def _flush_later(self, key: Tuple[int, str]):
+        while True:
+            delay = self._seen[key] + self.window - monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        await self._flush(key)
+
+    async def _flush(self, key: Tuple[int, str]):
+        self._timers.pop(key, None)
+        self._seen.pop(key, None)
+        parts = self._parts.pop(key, None)
+        callback = self._callbacks.pop(key, None)
+        if not parts or callback is None:
+            return
+        parts.sort(key=lambda part: part.message_id)
+        try:
+            await callback(parts)
+        except Exception as e:
+            logging.exception(f"Ошибка обработки альбома {key[1]} в чате {key[0]}: {e}")
+
+    async def close(self): #разобрать все недособранные альбомы, например при остановке
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        await asyncio.gather(*(self._flush(key) for key in list(self._parts)))
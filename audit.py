@@ -0,0 +1,81 @@
+import asyncio
+import json
+import logging
+import sqlite3
+from time import time
+from typing import List, Optional
+from metrics import metrics
+
+AUDIT_INTERVAL = 1.0
+AUDIT_BATCH = 500
+AUDIT_MAX_PENDING = 100_000
+FIELDS = ("ts", "chat", "topic", "user", "message_id", "content_type", "rule", "actions", "latency_ms", "delay_s")
+
+class AuditLog:
+    # журнал решений модерации: записи копятся в памяти и дописываются пачками в отдельном потоке
+    def __init__(self, path: Optional[str] = None, type: str = "jsonl", interval: float = AUDIT_INTERVAL,
+                 batch: int = AUDIT_BATCH, max_pending: int = AUDIT_MAX_PENDING):
+        self.path = path
+        self.kind = type
+        self.interval = interval
+        self.batch = batch
+        self.max_pending = max_pending
+        self._pending: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self._closing = asyncio.Event()
+        self._db = None
+        if path and type == "sqlite":
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS audit (ts REAL, chat INTEGER, topic TEXT, user INTEGER, message_id INTEGER, "
+                "content_type TEXT, rule TEXT, actions TEXT, latency_ms REAL, delay_s REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS audit_message ON audit(chat, message_id)")
+
+    def record(self, **entry):
+        if not self.path:
+            return
+        if len(self._pending) >= self.max_pending:
+            # диск не успевает — теряем старое, но не тормозим модерацию
+            del self._pending[:self.batch]
+            metrics.inc("bot_audit_dropped_total", self.batch)
+        entry["ts"] = time()
+        self._pending.append(entry)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._pending:
+            if len(self._pending) < self.batch and not self._closing.is_set():
+                try:
+                    await asyncio.wait_for(self._closing.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            await self.flush()
+
+    async def flush(self):
+        entries, self._pending = self._pending, []
+        if not entries:
+            return
+        try:
+            await asyncio.to_thread(self._write, entries)
+        except Exception as e:
+            logging.error(f"Ошибка записи журнала модерации: {e}")
+
+    def _write(self, entries: List[dict]):
+        if self._db is not None:
+            self._db.executemany(
+                f"INSERT INTO audit ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+                [tuple(json.dumps(entry[field]) if field == "actions" else entry.get(field) for field in FIELDS)
+                 for entry in entries])
+        else:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+
+    async def close(self):
+        self._closing.set()
+        if self._task is not None and not self._task.done():
+            await self._task
+        await self.flush()
+        if self._db is not None:
+            self._db.close()
@@ -0,0 +1,17 @@
+from html import escape
+from aiogram.types import Message, User
+
+def mention_html(user: User) -> str:
+    if user.username:
+        return f"@{user.username}"
+    return f'<a href="tg://user?id={user.id}">{escape(user.first_name)}</a>'
+
+def sender_mention(message: Message) -> str:
+    # автор берётся из самого апдейта: Telegram всегда присылает first_name, запрос к API не нужен;
+    # сообщение от имени канала или группы подписывается её названием
+    if message.sender_chat is not None:
+        chat = message.sender_chat
+        return f"@{chat.username}" if chat.username else escape(chat.title or str(chat.id))
+    if message.from_user is not None:
+        return mention_html(message.from_user)
+    return ""
@@ -0,0 +1,224 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import GetChatAdministrators, GetChatMember
+from aiogram.types import ChatMemberAdministrator, ChatMemberMember, Update, User
+import load_config
+
+# офлайн-замер горячего пути модерации: синтетические апдейты -> router -> бот-заглушка
+
+CHAT_BASE = -1001000000000
+TOPICS_PER_GROUP = 100
+USERS = 5000
+CONTENT_FLAGS = ("photo", "video", "text", "audio", "voice", "video_voice", "polls", "files", "sticker", "gif")
+
+class RecordingBot(Bot):
+    # вместо сети запоминает вызовы Bot API
+    def __init__(self):
+        super().__init__("123456:BENCHMARK")
+        self.calls = Counter()
+        self.deleted = 0
+
+    async def __call__(self, method, request_timeout=None):
+        name = type(method).__name__
+        self.calls[name] += 1
+        if name == "DeleteMessage":
+            self.deleted += 1
+        elif name == "DeleteMessages":
+            self.deleted += len(method.message_ids)
+        if isinstance(method, GetChatMember):
+            return ChatMemberMember(user=User(id=method.user_id, is_bot=False, first_name="user"))
+        if isinstance(method, GetChatAdministrators):
+            return [ChatMemberAdministrator(
+                user=User(id=1, is_bot=False, first_name="admin"), can_be_edited=False, is_anonymous=False,
+                can_manage_chat=True, can_delete_messages=True, can_manage_video_chats=True,
+                can_restrict_members=True, can_promote_members=True, can_change_info=True,
+                can_invite_users=True, can_post_stories=True, can_edit_stories=True, can_delete_stories=True,
+                can_send_welcome_messages=True)]
+        return True
+
+def build_config(topics: int, domains: int, rnd: random.Random) -> dict:
+    group_settings = {}
+    for index in range(topics):
+        group_id = str(CHAT_BASE - index // TOPICS_PER_GROUP)
+        group = group_settings.setdefault(group_id, {"name": group_id, "topics": {}})
+        topic_id = "default" if index % TOPICS_PER_GROUP == 0 else str(1000 + index % TOPICS_PER_GROUP)
+        group["topics"][topic_id] = {
+            "name": f"topic {index}",
+            **{flag: rnd.random() < 0.3 for flag in CONTENT_FLAGS},
+            "text": False,
+            "allowed_hashtags": [f"#tag{n}" for n in range(5)],
+            "allowed_links": [f"partner{n}.example.com" for n in range(domains)],
+            "forward_to_topics": [],
+            "content_tracking": True,
+            "is_general": topic_id == "default",
+            "forward_mentions": True,
+            "message_count": 0
+        }
+    for group in group_settings.values():
+        ids = list(group["topics"])
+        for topic_id, topic in group["topics"].items():
+            others = [tid for tid in ids if tid != topic_id]
+            topic["forward_to_topics"] = rnd.sample(others, min(2, len(others)))
+    return {"api_token": "123456:BENCHMARK", "group_settings": group_settings}
+
+def build_update(update_id: int, config: dict, domains: int, rnd: random.Random) -> dict:
+    group_id = rnd.choice(list(config["group_settings"]))
+    topic_id = rnd.choice(list(config["group_settings"][group_id]["topics"]))
+    user = {"id": rnd.randrange(1, USERS), "is_bot": False, "first_name": "user", "username": "user"}
+    message = {"message_id": update_id, "date": 0, "from": user,
+               "chat": {"id": int(group_id), "type": "supergroup", "title": group_id, "is_forum": True}}
+    if topic_id != "default":
+        message["message_thread_id"] = int(topic_id)
+        message["is_topic_message"] = True
+    if topic_id == "default" or rnd.random() < 0.5:
+        message["reply_to_message"] = {
+            "message_id": max(1, update_id - 1), "date": 0, "chat": message["chat"],
+            "from": {"id": rnd.randrange(1, USERS), "is_bot": False, "first_name": "author"}}
+    kind = rnd.choice(("text", "text", "photo", "video", "sticker", "voice", "document", "animation", "poll"))
+    words = ["lorem", "ipsum", "dolor", "sit", "amet"] * 4
+    if rnd.random() < 0.3:
+        words.append(f"#tag{rnd.randrange(10)}")
+    if rnd.random() < 0.3:
+        words.append(f"https://partner{rnd.randrange(max(domains, 1) * 2)}.example.com/page")
+    text = " ".join(words)
+    entities = []
+    offset = 0
+    for word in words:
+        if word.startswith("#"):
+            entities.append({"type": "hashtag", "offset": offset, "length": len(word)})
+        elif word.startswith("https://"):
+            entities.append({"type": "url", "offset": offset, "length": len(word)})
+        offset += len(word) + 1
+    if rnd.random() < 0.1:
+        entities.append({"type": "text_link", "offset": 0, "length": 5, "url": "https://www.partner0.example.com"})
+    if kind == "text":
+        message["text"], message["entities"] = text, entities
+    else:
+        media = {"file_id": f"f{update_id}", "file_unique_id": f"u{update_id}"}
+        if kind == "photo":
+            message["photo"] = [{**media, "width": 10, "height": 10}]
+        elif kind == "video":
+            message["video"] = {**media, "width": 10, "height": 10, "duration": 1}
+        elif kind == "sticker":
+            message["sticker"] = {**media, "type": "regular", "width": 10, "height": 10, "is_animated": False, "is_video": False}
+        elif kind == "voice":
+            message["voice"] = {**media, "duration": 1}
+        elif kind == "document":
+            message["document"] = media
+        elif kind == "animation":
+            message["animation"] = {**media, "width": 10, "height": 10, "duration": 1}
+            message["document"] = media
+        else:
+            message["poll"] = {"id": str(update_id), "question": "?", "options": [], "total_voter_count": 0,
+                               "is_closed": False, "is_anonymous": True, "type": "regular", "allows_multiple_answers": False,
+                               "allows_revoting": False, "members_only": False}
+        if kind in ("photo", "video", "document", "animation") and rnd.random() < 0.5:
+            message["caption"], message["caption_entities"] = text, entities
+    return {"update_id": update_id, "message": message}
+
+async def settle(handlers):
+    # пересылки и сводки идут фоном: дождаться их и удалений, которые они держат
+    await handlers.digests.close()
+    await handlers.fanout.close()
+    await handlers.deleter.close()
+
+async def run_case(handlers, dp: Dispatcher, topics: int, domains: int, count: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    config = build_config(topics, domains, rnd)
+    handlers.group_settings.clear()
+    handlers.group_settings.update(config["group_settings"])
+    handlers.loaded_chats.clear()
+    handlers.loaded_chats.update(map(int, handlers.group_settings))
+    handlers.rules.rebuild(handlers.group_settings)
+    bot = RecordingBot()
+    updates = [Update.model_validate(build_update(n, config, domains, rnd), context={"bot": bot})
+               for n in range(1, count + 1)]
+    for update in updates[:50]:
+        await dp.feed_update(bot, update)
+    await settle(handlers)
+    bot.calls.clear()
+    bot.deleted = 0
+    latencies = []
+    started = time.perf_counter()
+    for update in updates:
+        t = time.perf_counter()
+        await dp.feed_update(bot, update)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    await settle(handlers)
+    violations, calls = bot.deleted, sum(bot.calls.values())
+    api_calls = dict(bot.calls)
+    tracemalloc.start()
+    peaks = []
+    for update in updates[:min(count, 500)]:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        await dp.feed_update(bot, update)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    await settle(handlers)
+    latencies.sort()
+    return {
+        "topics": topics,
+        "domains": domains,
+        "msg_per_s": round(count / elapsed),
+        "p50_us": round(latencies[len(latencies) // 2] * 1e6, 1),
+        "p99_us": round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+        "alloc_kib_per_msg": round(statistics.mean(peaks) / 1024, 2),
+        "violations": violations,
+        "api_calls_per_violation": round(calls / violations, 2) if violations else 0.0,
+        "api_calls": api_calls
+    }
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bot_data.json")
+        with open(path, "w", encoding="utf-8") as f:
+            # лимиты шлюза сняты: замеряется путь модерации, а не ожидание токенов
+            json.dump({"api_token": "123456:BENCHMARK", "group_settings": {},
+                       "gateway": {"global_rate": 1e9, "group_rate": 1e9, "group_burst": 10 ** 9}}, f)
+        load_config.SAVE_FILE = path
+        import handlers
+    if not args.log:
+        logging.disable(logging.CRITICAL)
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(handlers.router)
+    results = []
+    for topics in args.topics:
+        for domains in args.domains:
+            if topics * domains > args.max_entries:
+                print(f"пропуск topics={topics} domains={domains}: больше --max-entries", file=sys.stderr)
+                continue
+            result = await run_case(handlers, dp, topics, domains, args.messages, args.seed)
+            results.append(result)
+            if not args.json:
+                print(f"topics={topics:>6} domains={domains:>5} {result['msg_per_s']:>8} msg/s "
+                      f"p50={result['p50_us']:>8}us p99={result['p99_us']:>8}us "
+                      f"alloc={result['alloc_kib_per_msg']:>6}KiB/msg "
+                      f"api/violation={result['api_calls_per_violation']}")
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=4))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Микробенчмарк check_content / is_content_allowed")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--topics", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--domains", type=int, nargs="+", default=[0, 100, 1000])
+    parser.add_argument("--max-entries", type=int, default=1_000_000,
+                        help="пропускать сочетания, где topics * domains больше этого числа")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="вывести результаты в JSON")
+    parser.add_argument("--log", action="store_true", help="не отключать логирование во время замеров")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,44 @@
+import asyncio
+import logging
+from time import monotonic
+from typing import Awaitable, Callable, List, Optional
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from metrics import metrics
+
+CATCHUP_BATCH = 100  # предел getUpdates
+
+async def feed_updates(dp: Dispatcher, bot: Bot, updates: List[Update]):
+    # планировщик чатов сохраняет порядок внутри чата, поэтому пачку можно отдавать разом
+    await asyncio.gather(*(dp.feed_update(bot, update) for update in updates))
+
+async def drain_backlog(bot: Bot, allowed_updates: Optional[List[str]], feed: Callable[[List[Update]], Awaitable[None]],
+                        batch: int = CATCHUP_BATCH, settle: Optional[Callable[[], Awaitable[None]]] = None) -> Optional[int]:
+    # разбирает всё, что накопилось, пока бота не было; возвращает offset для обычного режима.
+    # feed с планировщиком только ставит апдейты в очереди чатов, settle дожидается их обработки
+    await bot.delete_webhook(drop_pending_updates=False)
+    started = monotonic()
+    offset = None
+    handled = skipped = 0
+    while True:
+        updates = await bot.get_updates(offset=offset, limit=batch, timeout=0, allowed_updates=allowed_updates)
+        if not updates:
+            break
+        offset = updates[-1].update_id + 1
+        # нажатия кнопок из старых меню уже не актуальны, на них не ответить вовремя
+        fresh = [update for update in updates if update.callback_query is None]
+        skipped += len(updates) - len(fresh)
+        handled += len(fresh)
+        if fresh:
+            await feed(fresh)
+        if len(updates) < batch:
+            break
+    if settle is not None:
+        await settle()
+    if offset is not None:
+        # подтверждаем разобранное, чтобы обычный режим не получил его повторно
+        await bot.get_updates(offset=offset, limit=1, timeout=0, allowed_updates=allowed_updates)
+    metrics.inc("bot_backlog_updates_total", handled, outcome="handled")
+    metrics.inc("bot_backlog_updates_total", skipped, outcome="skipped")
+    logging.info(f"Накопившиеся апдейты: {handled} разобрано, {skipped} пропущено за {monotonic() - started:.1f} с")
+    return offset
@@ -0,0 +1,92 @@
+import asyncio
+import copy
+import logging
+from typing import Callable, Dict, Hashable, Optional, Set
+from metrics import metrics
+
+WATCH_INTERVAL = 2.0
+
+def diff_group(old: Optional[dict], new: Optional[dict]) -> Optional[Set[str]]:
+    # None — группа не менялась; иначе изменённые, добавленные и удалённые топики
+    if old == new:
+        return None
+    old_topics = (old or {}).get("topics", {})
+    new_topics = (new or {}).get("topics", {})
+    return {topic_id for topic_id in old_topics.keys() | new_topics.keys()
+            if old_topics.get(topic_id) != new_topics.get(topic_id)}
+
+class ConfigWatcher:
+    # опрашивает метку источника конфига (mtime файла или версию базы) и применяет только группы,
+    # изменённые в самом источнике с прошлого чтения: память бывает новее источника (свои правки
+    # до записи, правки соседних шардов по рассылке), и старая копия из источника её не откатывает
+    def __init__(self, stamp: Callable[[], Hashable], load: Callable[[], Dict[str, dict]],
+                 current: Callable[[], Dict[str, dict]], apply: Callable[[str, Optional[dict], Set[str]], None],
+                 busy: Callable[[], bool], versions: Dict[str, int], interval: float = WATCH_INTERVAL,
+                 enabled: bool = True):
+        self.stamp = stamp
+        self.load = load
+        self.current = current
+        self.apply = apply
+        self.busy = busy
+        self.versions = versions
+        self.interval = interval
+        self.enabled = enabled
+        self._task: Optional[asyncio.Task] = None
+        self._source: Optional[Dict[str, dict]] = None  # источник при прошлом чтении
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        seen = await asyncio.to_thread(self.stamp)
+        if self._source is None:
+            self._source = await asyncio.to_thread(self.load)
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                stamp = await asyncio.to_thread(self.stamp)
+                # пока свои правки не записаны, источник отстаёт от памяти — ждём записи
+                if stamp == seen or self.busy():
+                    continue
+                await self.reload()
+                seen = stamp
+            except Exception as e:
+                # битый или недописанный файл: метку не запоминаем и перечитаем на следующем круге
+                logging.error(f"Ошибка перезагрузки конфига: {e}")
+
+    async def reload(self) -> int:
+        versions = dict(self.versions)
+        loaded = await asyncio.to_thread(self.load)
+        current = self.current()
+        previous = current if self._source is None else self._source
+        changed = 0
+        for group_id in current.keys() | loaded.keys():
+            if self.versions.get(group_id, 0) != versions.get(group_id, 0):
+                # группу правили, пока читали источник: её свежая версия ещё будет записана
+                continue
+            if previous.get(group_id) == loaded.get(group_id) or (group_id not in previous and group_id in current):
+                # в источнике группа не менялась или память получила её позже прошлого чтения:
+                # расхождение с памятью — более новая правка, а не повод откатывать
+                continue
+            topic_ids = diff_group(current.get(group_id), loaded.get(group_id))
+            if topic_ids is None:
+                continue
+            # без await между сравнением и заменой: обработчики видят либо старую группу, либо новую
+            # копия: память дальше правится на месте, а прочитанное остаётся образцом для следующего сравнения
+            self.apply(group_id, copy.deepcopy(loaded.get(group_id)), topic_ids)
+            changed += 1
+            logging.info(f"Конфиг группы {group_id} перезагружен, топиков изменено: {len(topic_ids)}")
+        self._source = loaded
+        if changed:
+            metrics.inc("bot_config_reloads_total")
+        return changed
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
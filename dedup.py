@@ -0,0 +1,60 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import Optional
+from aiogram.types import Message
+
+DUPLICATE_TTL = 3600.0
+MAX_ENTRIES = 200_000
+MIN_TEXT = 16  # короткие «ок», «+» и т.п. повторяются честно
+
+def message_fingerprint(message: Message, min_text: int = MIN_TEXT) -> Optional[int]:
+    # медиа — по file_unique_id, текст — по хешу нормализованной строки; 8 байт на запись
+    media = message.photo[-1] if message.photo else (
+        message.video or message.animation or message.document or message.sticker
+        or message.voice or message.video_note or message.audio)
+    if media is not None:
+        source = "m" + media.file_unique_id
+    else:
+        text = message.text or message.caption
+        if not text:
+            return None
+        source = " ".join(text.casefold().split())
+        if len(source) < min_text:
+            return None
+        source = "t" + source
+    return int.from_bytes(blake2b(source.encode(), digest_size=8).digest(), "big")
+
+class DuplicateIndex:
+    # очередь отпечатков по группе с TTL и пределом размера: ключ — (чат, отпечаток) в одном целом,
+    # значение — время первого появления, поэтому самые старые всегда в голове
+    def __init__(self, ttl: float = DUPLICATE_TTL, max_entries: int = MAX_ENTRIES, min_text: int = MIN_TEXT):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.min_text = min_text
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _expire(self, now: float):
+        while self._seen:
+            key, first = next(iter(self._seen.items()))
+            if now - first < self.ttl and len(self._seen) <= self.max_entries:
+                break
+            del self._seen[key]
+
+    def check(self, message: Message, window: float) -> bool: #True, если такое уже было в группе за window секунд
+        fingerprint = message_fingerprint(message, self.min_text)
+        if fingerprint is None:
+            return False
+        key = message.chat.id * (1 << 64) + fingerprint
+        # время сообщения, а не приёма: догоняющий после простоя поток не сжимает окно
+        now = message.date.timestamp()
+        first = self._seen.get(key)
+        if first is not None and abs(now - first) < min(window, self.ttl):
+            return True
+        # новое или устаревшее — запоминаем заново, в хвост очереди
+        self._seen.pop(key, None)
+        self._seen[key] = now
+        self._expire(now)
+        return False
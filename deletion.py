@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from metrics import metrics
+
+DELETE_WINDOW = 0.2
+DELETE_BATCH = 100  # предел delete_messages
+DELETE_RETRIES = 2
+
+class DeleteBatcher:
+    # копит id нарушений по чату и удаляет их одним delete_messages
+    def __init__(self, window: float = DELETE_WINDOW, retries: int = DELETE_RETRIES):
+        self.window = window
+        self.retries = retries
+        self._pending: Dict[int, List[Tuple[int, Optional[str]]]] = {}
+        self._bots: Dict[int, Bot] = {}
+        self._timers: Dict[int, asyncio.Task] = {}
+        self._flushing = set()
+        self._holds: Dict[int, Set[asyncio.Task]] = {}
+
+    def schedule(self, bot: Bot, chat_id: int, message_id: int, topic_id: Optional[str] = None,
+                 after: Optional[asyncio.Task] = None):
+        # after — пересылка этого сообщения: пакет не уходит раньше неё, иначе пересылать будет нечего
+        if after is not None and not after.done():
+            self._holds.setdefault(chat_id, set()).add(after)
+        batch = self._pending.setdefault(chat_id, [])
+        batch.append((message_id, topic_id))
+        self._bots[chat_id] = bot
+        if len(batch) >= DELETE_BATCH:
+            timer = self._timers.pop(chat_id, None)
+            if timer:
+                timer.cancel()
+            self._spawn(self._flush(chat_id))
+        elif chat_id not in self._timers:
+            # таймер тоже в _flushing: после снятия с _timers он ещё может быть посреди запроса
+            self._timers[chat_id] = self._spawn(self._flush_later(chat_id))
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+        return task
+
+    async def _flush_later(self, chat_id: int):
+        await asyncio.sleep(self.window)
+        self._timers.pop(chat_id, None)
+        await self._flush(chat_id)
+
+    async def _flush(self, chat_id: int):
+        batch = self._pending.pop(chat_id, None)
+        bot = self._bots.pop(chat_id, None)
+        holds = self._holds.pop(chat_id, None)
+        if holds:
+            await asyncio.wait(holds)
+        if not batch or bot is None:
+            return
+        message_ids = [message_id for message_id, _ in batch]
+        for attempt in range(self.retries + 1):
+            try:
+                await bot.delete_messages(chat_id=chat_id, message_ids=message_ids)
+                self._count(chat_id, batch)
+                return
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                logging.error(f"Ошибка пакетного удаления в чате {chat_id}: {e}")
+                break
+        # пакет не прошёл — удаляем по одному, чтобы одно сообщение не держало остальные
+        results = await asyncio.gather(
+            *(bot.delete_message(chat_id=chat_id, message_id=message_id) for message_id in message_ids),
+            return_exceptions=True)
+        deleted = []
+        for item, result in zip(batch, results):
+            if isinstance(result, Exception):
+                logging.error(f"Ошибка удаления сообщения: {result}")
+            else:
+                deleted.append(item)
+        self._count(chat_id, deleted)
+
+    def _count(self, chat_id: int, batch: List[Tuple[int, Optional[str]]]):
+        for _, topic_id in batch:
+            metrics.inc("bot_messages_total", chat=chat_id, topic=topic_id, outcome="deleted")
+
+    async def close(self): #сбросить всё накопленное, например при остановке
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        await asyncio.gather(*self._flushing, return_exceptions=True)
+        await asyncio.gather(*(self._flush(chat_id) for chat_id in list(self._pending)))
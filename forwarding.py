@@ -0,0 +1,177 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from time import monotonic
+from aiogram import Bot
+from aiogram.types import Message
+from deletion import DeleteBatcher
+from gateway import ApiGateway
+from metrics import metrics
+from rules import DIGEST_THRESHOLD
+
+FORWARD_CONCURRENCY = 32  # токен чата берётся до семафора: слот не занят ожиданием лимита одного чата
+FORWARD_BATCH = 100  # предел forward_messages
+DIGEST_WINDOW = 3.0  # окно сводки для нарушений, которым не хватило лимита отправки в чат
+DIGEST_OFFENDERS = 30  # строк с нарушителями в одной сводке
+
+_semaphore = asyncio.Semaphore(FORWARD_CONCURRENCY)
+
+async def _forward(bot: Bot, chat_id: int, thread_id: Optional[int], message_ids: List[int]) -> bool:
+    async with _semaphore:
+        try:
+            await bot.forward_messages(
+                chat_id=chat_id,
+                from_chat_id=chat_id,
+                message_ids=message_ids,
+                message_thread_id=thread_id
+            )
+            return True
+        except Exception as e:
+            logging.error(f"Ошибка пересылки: {e}")
+            return False
+
+async def _send_html(bot: Bot, chat_id: int, thread_id: Optional[int], text: str):
+    async with _semaphore:
+        try:
+            await bot.send_message(chat_id, text, parse_mode="HTML", message_thread_id=thread_id)
+        except Exception as e:
+            logging.error(f"Ошибка пересылки: {e}")
+
+def _message_ids(messages: List[Message]) -> Set[int]: #нарушения и сообщения, на которые они отвечают
+    message_ids = set()
+    for message in messages:
+        message_ids.add(message.message_id)
+        if message.reply_to_message:
+            message_ids.add(message.reply_to_message.message_id)
+    return message_ids
+
+async def forward_violation(bot: Bot, messages: List[Message], targets: Iterable[Optional[int]]) -> int:
+    # нарушение (или весь альбом) вместе с оригиналом уходит одним forward_messages в каждый топик параллельно;
+    # токены чата на эти пересылки вызывающий уже взял через ApiGateway.reserve
+    chat_id = messages[0].chat.id
+    message_ids = sorted(_message_ids(messages))
+    forwarded = await asyncio.gather(*(_forward(bot, chat_id, thread_id, message_ids) for thread_id in targets))
+    return sum(forwarded)
+
+async def send_mentions(bot: Bot, chat_id: int, targets: Iterable[Optional[int]], gateway: ApiGateway, mention: str):
+    # упоминание автора идёт за пересылками; лимит чата ждём до семафора, чтобы не занимать слот
+    targets = list(targets)
+    await gateway.wait_reserve(chat_id, len(targets))
+    await asyncio.gather(*(_send_html(bot, chat_id, thread_id, mention) for thread_id in targets))
+
+class FanoutTasks:
+    # фоновые пересылки нарушений: очередь чата ждёт только решения, а не ответов Bot API
+    def __init__(self):
+        self._running = set()
+
+    def spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        return task
+
+    async def close(self): #дождаться начатых пересылок, например при остановке
+        while self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+class _Digest:
+    __slots__ = ("bot", "targets", "window", "message_ids", "deletions", "offenders", "mentions", "count")
+
+    def __init__(self, bot: Bot, targets: Tuple[Optional[int], ...], window: float):
+        self.bot = bot
+        self.targets = targets
+        self.window = window
+        self.message_ids: Set[int] = set()
+        self.deletions: List[int] = []
+        self.offenders = Counter()
+        self.mentions = Counter()
+        self.count = 0
+
+class ViolationDigest:
+    # при наплыве нарушения топика копятся окно и уходят в каждый целевой топик
+    # пачкой forward_messages и одной сводкой; удаление откладывается до пересылки
+    def __init__(self, deleter: DeleteBatcher, gateway: ApiGateway):
+        self.deleter = deleter
+        self.gateway = gateway
+        self._digests: Dict[Tuple[int, str], _Digest] = {}
+        self._recent: Dict[Tuple[int, str], Tuple[float, int]] = {}  # начало окна и нарушений в нём
+        self._timers: Dict[Tuple[int, str], asyncio.Task] = {}
+        self._tasks = FanoutTasks()
+
+    def accepts(self, chat_id: int, topic_id: str, window: float, threshold: int = DIGEST_THRESHOLD) -> bool:
+        # первые threshold нарушений за окно пересылаются сразу, следующие идут в сводку
+        key = (chat_id, topic_id)
+        if key in self._digests:
+            return True
+        now = monotonic()
+        started, count = self._recent.get(key, (now, 0))
+        if now - started >= window:
+            started, count = now, 0
+        if count < threshold:
+            self._recent[key] = (started, count + 1)
+            return False
+        self._recent.pop(key, None)
+        return True
+
+    def add(self, bot: Bot, messages: List[Message], targets: Iterable[Optional[int]], window: float,
+            topic_id: str, offender: str, mention: str = ""):
+        key = (messages[0].chat.id, topic_id)
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = self._digests[key] = _Digest(bot, tuple(targets), window)
+            self._timers[key] = self._tasks.spawn(self._flush_later(key))
+        digest.message_ids |= _message_ids(messages)
+        digest.deletions.extend(message.message_id for message in messages)
+        digest.offenders[offender] += 1
+        if mention:
+            digest.mentions[mention] += 1
+        digest.count += 1
+
+    async def _flush_later(self, key: Tuple[int, str]):
+        await asyncio.sleep(self._digests[key].window)
+        await self._flush(key)
+
+    async def _flush(self, key: Tuple[int, str]):
+        self._timers.pop(key, None)
+        digest = self._digests.pop(key, None)
+        if digest is None:
+            return
+        chat_id, topic_id = key
+        message_ids = sorted(digest.message_ids)
+        summary = self._summary(digest)
+
+        async def deliver(thread_id: Optional[int]) -> bool:
+            forwarded = True
+            for start in range(0, len(message_ids), FORWARD_BATCH):
+                await self.gateway.wait_reserve(chat_id)
+                forwarded &= await _forward(digest.bot, chat_id, thread_id, message_ids[start:start + FORWARD_BATCH])
+            await self.gateway.wait_reserve(chat_id)
+            await _send_html(digest.bot, chat_id, thread_id, summary)
+            return forwarded
+
+        forwarded = await asyncio.gather(*(deliver(thread_id) for thread_id in digest.targets))
+        for message_id in digest.deletions:
+            self.deleter.schedule(digest.bot, chat_id, message_id, topic_id)
+        if any(forwarded):
+            metrics.inc("bot_messages_total", sum(forwarded) * digest.count, chat=chat_id, topic=topic_id,
+                        outcome="forwarded")
+        metrics.inc("bot_digests_total", chat=chat_id, topic=topic_id)
+
+    @staticmethod
+    def _summary(digest: _Digest) -> str:
+        lines = [f"Нарушений за {digest.window:g} с: {digest.count}"]
+        lines += [f"{offender} — {count}" for offender, count in digest.offenders.most_common(DIGEST_OFFENDERS)]
+        if len(digest.offenders) > DIGEST_OFFENDERS:
+            lines.append(f"и ещё {len(digest.offenders) - DIGEST_OFFENDERS}")
+        if digest.mentions:
+            lines.append("В ответ на: " + ", ".join(
+                mention for mention, _ in digest.mentions.most_common(DIGEST_OFFENDERS)))
+        return "\n".join(lines)
+
+    async def close(self): #разослать все незакрытые сводки, например при остановке
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        await self._tasks.close()
+        await asyncio.gather(*(self._flush(key) for key in list(self._digests)))
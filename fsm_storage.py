@@ -0,0 +1,63 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Mapping, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+def storage_key(key: StorageKey) -> str:
+    return ":".join(str(part) for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id,
+        getattr(key, "business_connection_id", None), key.destiny))
+
+class SQLiteStorage(BaseStorage):
+    # общее для нескольких процессов хранилище FSM в одном файле SQLite
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT)")
+
+    def _execute(self, sql: str, params: tuple):
+        with self._lock:
+            return self._db.execute(sql, params).fetchone()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO fsm (key, state) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (storage_key(key), value))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await asyncio.to_thread(self._execute, "SELECT state FROM fsm WHERE key = ?", (storage_key(key),))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO fsm (key, data) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (storage_key(key), json.dumps(dict(data), ensure_ascii=False)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await asyncio.to_thread(self._execute, "SELECT data FROM fsm WHERE key = ?", (storage_key(key),))
+        return json.loads(row[0]) if row and row[0] else {}
+
+    async def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+def create_storage(settings: Optional[dict]) -> BaseStorage:
+    # {"type": "redis", "url": ...} для нескольких машин, {"type": "sqlite", "path": ...} для одной
+    settings = settings or {}
+    kind = settings.get("type", "memory")
+    if kind == "redis":
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(settings["url"])
+    if kind == "sqlite":
+        return SQLiteStorage(settings.get("path", "fsm.db"))
+    return MemoryStorage()
@@ -0,0 +1,186 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import Counter, OrderedDict
+from time import monotonic
+from typing import Optional
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+PRIORITY_DELETE, PRIORITY_FORWARD, PRIORITY_ADMIN = 0, 1, 2
+
+METHOD_PRIORITY = {
+    "deleteMessage": PRIORITY_DELETE,
+    "deleteMessages": PRIORITY_DELETE,
+    "restrictChatMember": PRIORITY_DELETE,
+    "forwardMessage": PRIORITY_FORWARD,
+    "forwardMessages": PRIORITY_FORWARD,
+    "copyMessage": PRIORITY_FORWARD,
+    "copyMessages": PRIORITY_FORWARD,
+    "sendMessage": PRIORITY_FORWARD,
+    "getChatMember": PRIORITY_FORWARD,
+    "editMessageText": PRIORITY_ADMIN,
+    "editMessageReplyMarkup": PRIORITY_ADMIN,
+    "answerCallbackQuery": PRIORITY_ADMIN
+}
+# лимиты Telegram на отправку в один чат касаются только этих методов
+SEND_METHODS = frozenset({
+    "forwardMessage", "forwardMessages", "copyMessage", "copyMessages", "sendMessage",
+    "editMessageText", "editMessageReplyMarkup"
+})
+# служебные вызовы не ограничиваем: getUpdates висит в long polling
+EXEMPT_METHODS = frozenset({"getUpdates", "getMe", "setWebhook", "deleteWebhook", "close", "logOut"})
+
+GLOBAL_RATE = 30.0
+GROUP_RATE = 20 / 60
+GROUP_BURST = 20
+PRIVATE_RATE = 1.0
+PRIVATE_BURST = 3
+MAX_RETRIES = 3
+MAX_CHATS = 10_000
+
+class TokenBucket:
+    # токены выдаются ожидающим строго по приоритету, затем по очереди
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self.blocked_until = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, monotonic() + seconds)
+
+    def try_acquire(self, count: int = 1) -> bool: #взять токены сразу или отказаться, не вставая в очередь
+        now = monotonic()
+        self._refill(now)
+        if self._waiters or now < self.blocked_until or self.tokens < count:
+            return False
+        self.tokens -= count
+        return True
+
+    async def acquire(self, priority: int = PRIORITY_FORWARD):
+        now = monotonic()
+        self._refill(now)
+        if not self._waiters and now >= self.blocked_until and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run())
+        await future
+
+    async def _run(self):
+        while self._waiters:
+            now = monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.tokens -= 1
+                future.set_result(None)
+
+class ApiGateway(BaseRequestMiddleware):
+    # единая точка выхода в Bot API: общий и початовые лимиты, приоритеты и повтор после RetryAfter
+    def __init__(self, global_rate: float = GLOBAL_RATE, group_rate: float = GROUP_RATE, group_burst: int = GROUP_BURST,
+                 private_rate: float = PRIVATE_RATE, private_burst: int = PRIVATE_BURST,
+                 max_retries: int = MAX_RETRIES, max_chats: int = MAX_CHATS):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.group_limits = (group_rate, group_burst)
+        self.private_limits = (private_rate, private_burst)
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self._reserved = Counter()  # chat_id -> токенов чата, взятых заранее через reserve
+
+    def split(self, parts: int): #доля общего лимита для одного из parts процессов бота
+        rate = self.global_bucket.rate / parts
+        self.global_bucket = TokenBucket(rate, max(rate, 1))
+
+    def chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            rate, burst = self.group_limits if chat_id < 0 else self.private_limits
+            bucket = self._chats[chat_id] = TokenBucket(rate, burst)
+            while len(self._chats) > self.max_chats:
+                oldest, old_bucket = next(iter(self._chats.items()))
+                if old_bucket._waiters:
+                    break
+                del self._chats[oldest]
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def reserve(self, chat_id: int, count: int = 1) -> bool:
+        # токены чата берутся до отправки и без ожидания: если лимит исчерпан, вызывающий
+        # откладывает отправку в сводку вместо того, чтобы ждать и держать очередь или слоты пересылок
+        if not self.chat_bucket(chat_id).try_acquire(count):
+            return False
+        self._reserved[chat_id] += count
+        return True
+
+    async def wait_reserve(self, chat_id: int, count: int = 1):
+        # то же с ожиданием: для фоновых отправок, которые должны дождаться лимита чата
+        bucket = self.chat_bucket(chat_id)
+        for _ in range(count):
+            await bucket.acquire(PRIORITY_FORWARD)
+        self._reserved[chat_id] += count
+
+    def _take_reserved(self, chat_id: int) -> bool:
+        if not self._reserved.get(chat_id):
+            return False
+        self._reserved[chat_id] -= 1
+        if not self._reserved[chat_id]:
+            del self._reserved[chat_id]
+        return True
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        if name in EXEMPT_METHODS:
+            return await make_request(bot, method)
+        priority = METHOD_PRIORITY.get(name, PRIORITY_FORWARD)
+        chat_id = getattr(method, "chat_id", None)
+        chat_bucket = self.chat_bucket(chat_id) if name in SEND_METHODS and isinstance(chat_id, int) else None
+        # токен чата уже взят заранее: вызов идёт в общей очереди вместе с удалениями, раньше своего пакета
+        reserved = chat_bucket is not None and self._take_reserved(chat_id)
+        if reserved:
+            priority = PRIORITY_DELETE
+        attempt = 0
+        while True:
+            if chat_bucket is not None and not reserved:
+                await chat_bucket.acquire(priority)
+            reserved = False
+            await self.global_bucket.acquire(priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logging.warning(f"Лимит Telegram на {name} в чате {chat_id}: повтор через {e.retry_after} с")
+                if chat_bucket is not None:
+                    chat_bucket.block(e.retry_after)
+                else:
+                    await asyncio.sleep(e.retry_after)
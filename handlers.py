@@ -1,25 +1,39 @@
 from aiogram import Bot
 import asyncio
 from aiogram.dispatcher.router import Router
-from aiogram.types import Message, User, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery, Chat
-from load_config import load_config, save_config
+from aiogram.types import Message, User, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery, Chat, ChatMemberUpdated, ChatPermissions
+from load_config import load_config, ConfigSaver, SAVE_FILE
+from storage import SQLiteStore, StoreSaver
+from rules import RuleSet, TopicRule, is_content_allowed, is_album_allowed, message_thread
+from admins import AdminCache, ADMIN_STATUSES
+from authors import sender_mention
+from forwarding import forward_violation, send_mentions, FanoutTasks, ViolationDigest, DIGEST_WINDOW
+from gateway import ApiGateway
+from deletion import DeleteBatcher
+from albums import AlbumCollector
+from flood import FloodControl, flood_key, OK, OFFENCE
+from dedup import DuplicateIndex
+from sessions import SessionStore, AdminSession
+from keyboards import KeyboardCache, paginate, toggle_button, SELECTED, UNSELECTED
+from logs import setup_logging
+from audit import AuditLog
+from config_watch import ConfigWatcher
+from metrics import metrics, HandlerMetricsMiddleware
 from aiogram.filters import Command, StateFilter
 from aiogram import F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 import logging
-from typing import Union
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from time import perf_counter, time
+from typing import Dict, List, Optional, Set, Tuple, Union
+import os
 router = Router()
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-
-formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s')
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(formatter)
-logger.addHandler(stream_handler)
-file_handler = logging.FileHandler("bot.log", encoding="utf-8")
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+for observer in (router.message, router.callback_query, router.chat_member, router.my_chat_member):
+    observer.middleware(HandlerMetricsMiddleware())
+bot_data = load_config()
+log_listener = setup_logging(bot_data.get("logging", {}))
 
 logging.getLogger("aiohttp").setLevel(logging.WARNING)
 logging.getLogger("asyncio").setLevel(logging.WARNING)
@@ -55,9 +69,109 @@ DEFAULT_TOPIC_SETTINGS = {
     "forward_mentions": False
 }
 
-bot_data = load_config()
-group_settings = bot_data.get("group_settings", {})
 token = bot_data.get("api_token")
+rules = RuleSet()
+if bot_data.get("storage") == "sqlite":
+    # группы подгружаются из базы при первом обращении
+    store = SQLiteStore(bot_data.get("database", "bot_data.db"))
+    group_settings = {}
+    config_saver = StoreSaver(store, group_settings)
+else:
+    store = None
+    group_settings = bot_data.setdefault("group_settings", {})
+    config_saver = ConfigSaver(lambda: bot_data)
+    rules.rebuild(group_settings)
+loaded_chats = set(map(int, group_settings))
+
+def ensure_group(group_id: str) -> Optional[dict]: #ленивая загрузка группы из хранилища
+    chat_id = int(group_id)
+    if chat_id not in loaded_chats:
+        loaded_chats.add(chat_id)
+        gdata = store.load_group(chat_id) if store else None
+        if gdata is not None:
+            group_settings[group_id] = gdata
+            rules.rebuild_group(group_id, gdata)
+    return group_settings.get(group_id)
+
+def admin_group_candidates(user_id: int) -> list:
+    if store:
+        return [str(chat_id) for chat_id in store.admin_group_ids(user_id) if ensure_group(str(chat_id))]
+    return [gid for gid, gdata in group_settings.items()
+            if "admins" not in gdata or user_id in gdata["admins"]]
+
+settings_listeners = [] #вызываются после каждой правки группы, например для рассылки по шардам
+group_versions = Counter() #растёт при каждой правке группы: по нему меню узнают об устаревших данных
+
+def save_settings(group_id: str, topic_id: Optional[str] = None): #сохранение конфига и пересборка правил группы
+    config_saver.mark_dirty(group_id, topic_id)
+    group_versions[group_id] += 1
+    rules.rebuild_group(group_id, group_settings.get(group_id))
+    for listener in settings_listeners:
+        listener(group_id, group_settings.get(group_id))
+
+def apply_group(group_id: str, gdata: Optional[dict]): #применить группу, изменённую в другом процессе
+    loaded_chats.add(int(group_id))
+    if gdata is None:
+        group_settings.pop(group_id, None)
+    else:
+        group_settings[group_id] = gdata
+    group_versions[group_id] += 1
+    rules.rebuild_group(group_id, gdata)
+
+def reload_group(group_id: str, gdata: Optional[dict], topic_ids: Set[str]): #применить группу, изменённую в файле или базе
+    current = group_settings.get(group_id)
+    if current is None or gdata is None:
+        apply_group(group_id, gdata)
+        return
+    # меняем словарь группы на месте: открытые меню держат ссылку на него
+    topics = current.setdefault("topics", {})
+    new_topics = gdata.get("topics", {})
+    for topic_id in topic_ids:
+        if topic_id in new_topics:
+            topics[topic_id] = new_topics[topic_id]
+        else:
+            topics.pop(topic_id, None)
+    for key in set(current) - set(gdata) - {"topics"}:
+        del current[key]
+    current.update((key, value) for key, value in gdata.items() if key != "topics")
+    group_versions[group_id] += 1
+    rules.rebuild_topics(group_id, current, topic_ids)
+
+def config_stamp(): #метка источника конфига: новая inode после атомарной записи, mtime и размер файла
+    if store:
+        return store.data_version()
+    stat = os.stat(SAVE_FILE)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def load_groups() -> Dict[str, dict]: #свежие настройки из источника; из базы — только уже загруженные группы
+    if store:
+        return {str(chat_id): gdata for chat_id in list(loaded_chats)
+                if (gdata := store.load_group(chat_id)) is not None}
+    return load_config().get("group_settings", {})
+
+def sync_admins(chat_id: int, admins) -> None: #копия списка админов в конфиге для меню в ЛС
+    gdata = group_settings.get(str(chat_id))
+    if gdata is None or set(gdata.get("admins", [])) == set(admins):
+        return
+    gdata["admins"] = sorted(admins)
+    config_saver.mark_dirty(str(chat_id))
+    group_versions[str(chat_id)] += 1
+    for listener in settings_listeners:
+        listener(str(chat_id), gdata)
+
+admin_cache = AdminCache(on_roster=sync_admins)
+gateway = ApiGateway(**bot_data.get("gateway", {}))
+deleter = DeleteBatcher(**bot_data.get("deletion", {}))
+digests = ViolationDigest(deleter, gateway)
+fanout = FanoutTasks()
+albums = AlbumCollector(**bot_data.get("albums", {}))
+flood = FloodControl(**bot_data.get("flood", {}))
+duplicates = DuplicateIndex(**bot_data.get("duplicates", {}))
+sessions = SessionStore(**bot_data.get("sessions", {}))
+keyboards = KeyboardCache()
+audit = AuditLog(**bot_data.get("audit", {}))
+watcher = ConfigWatcher(config_stamp, load_groups, lambda: group_settings, reload_group,
+                        lambda: config_saver.dirty, group_versions, **bot_data.get("reload", {}))
 
 def main_menu_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -65,18 +179,28 @@ def main_menu_keyboard() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="Команды", callback_data="commands")]
     ])
 
-def groups_menu_keyboard(allowed_groups: dict = None) -> InlineKeyboardMarkup:
+def groups_menu_keyboard(group_ids: Tuple[str, ...] = (), page: int = 0) -> InlineKeyboardMarkup:
+    group_ids = group_ids or tuple(group_settings)
+    key = ("groups", group_ids, tuple(group_versions[gid] for gid in group_ids), page)
+    return keyboards.get(key, lambda: _groups_menu_keyboard(group_ids, page))
+
+def _groups_menu_keyboard(group_ids: Tuple[str, ...], page: int) -> InlineKeyboardMarkup:
     buttons = []
-    groups = allowed_groups if allowed_groups else group_settings
-    for gid, info in groups.items():
+    for gid in group_ids:
+        info = ensure_group(gid) or {}
         buttons.append([InlineKeyboardButton(
             text=info.get("name", gid), 
             callback_data=f"group_{gid}"
         )])
+    buttons = paginate(buttons, page, "g")
     buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="main_menu")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def group_topics_keyboard(group_id: str) -> InlineKeyboardMarkup:
+def group_topics_keyboard(group_id: str, page: int = 0) -> InlineKeyboardMarkup:
+    return keyboards.get(("topics", group_id, group_versions[group_id], page),
+                         lambda: _group_topics_keyboard(group_id, page))
+
+def _group_topics_keyboard(group_id: str, page: int) -> InlineKeyboardMarkup:
     buttons = []
     topics = group_settings.get(group_id, {}).get("topics", {})
     for tid, conf in topics.items():
@@ -84,6 +208,7 @@ def group_topics_keyboard(group_id: str) -> InlineKeyboardMarkup:
             text=conf.get("name", tid), 
             callback_data=f"topic_{tid}"
         )])
+    buttons = paginate(buttons, page, "t")
     if topics:
         buttons.append([InlineKeyboardButton(text="Удалить топик", callback_data=f"del_topics_{group_id}")])
     buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="main_groups")])
@@ -101,14 +226,19 @@ def topic_options_keyboard(topic_id: str, group_id: str) -> InlineKeyboardMarkup
         [InlineKeyboardButton(text="🔙 Назад", callback_data=f"group_{group_id}")]
     ])
 
-def delete_topic_menu_keyboard(group_id: str) -> InlineKeyboardMarkup:
+def delete_topic_menu_keyboard(group_id: str, page: int = 0) -> InlineKeyboardMarkup:
+    return keyboards.get(("delete", group_id, group_versions[group_id], page),
+                         lambda: _delete_topic_menu_keyboard(group_id, page))
+
+def _delete_topic_menu_keyboard(group_id: str, page: int) -> InlineKeyboardMarkup:
     buttons = []
     topics = group_settings.get(group_id, {}).get("topics", {})
     for tid, conf in topics.items():
         buttons.append([InlineKeyboardButton(
             text=conf.get("name", tid), 
-            callback_data=f"delete_topic_{tid}_{group_id}"
+            callback_data=f"confirm_delete_{tid}_{group_id}"
         )])
+    buttons = paginate(buttons, page, "d", group_id)
     buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data=f"group_{group_id}")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
@@ -136,16 +266,24 @@ def content_settings_keyboard(topic: dict) -> InlineKeyboardMarkup:
     buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_topic_options")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def forward_settings_keyboard(group_id: str, current_topic_id: str, current_selection: list) -> InlineKeyboardMarkup:
+def forward_settings_keyboard(group_id: str, current_topic_id: str, current_selection: list,
+                              page: int = 0) -> InlineKeyboardMarkup:
+    # выбор хранится в конфиге топика, поэтому версии группы достаточно для ключа
+    return keyboards.get(("forward", group_id, current_topic_id, group_versions[group_id], page),
+                         lambda: _forward_settings_keyboard(group_id, current_topic_id, current_selection, page))
+
+def _forward_settings_keyboard(group_id: str, current_topic_id: str, current_selection: list,
+                               page: int) -> InlineKeyboardMarkup:
     buttons = []
     topics = group_settings.get(group_id, {}).get("topics", {})
     for tid, conf in topics.items():
         if tid == current_topic_id: continue
-        sel = "✅" if tid in current_selection else "❌"
+        sel = SELECTED if tid in current_selection else UNSELECTED
         buttons.append([InlineKeyboardButton(
             text=f"{conf.get('name', tid)} {sel}", 
             callback_data=f"forward_toggle_{tid}"
         )])
+    buttons = paginate(buttons, page, "f")
     buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_topic_options")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
@@ -160,33 +298,42 @@ async def check_admin(event: Union[Message, CallbackQuery], bot: Bot) -> bool:
     chat = event.chat if isinstance(event, Message) else event.message.chat
     if chat.type == "private": return True
     try:
-        admins = await bot.get_chat_administrators(chat.id)
-        return any(admin.user.id == user.id for admin in admins)
+        return await admin_cache.is_admin(bot, chat.id, user.id)
     except Exception as e:
         logging.error(f"Ошибка проверки администратора: {e}")
         return False
 
-def is_content_allowed(message: Message, settings: dict) -> bool:
-    content_types = {
-        'photo': 'photo', 'video': 'video', 'audio': 'audio',
-        'voice': 'voice', 'video_note': 'video_voice',
-        'poll': 'polls', 'document': 'files',
-        'sticker': 'sticker', 'animation': 'gif'
-    }
-    for attr, key in content_types.items():
-        if getattr(message, attr, None) and settings.get(key, False):
-            return True
-    text_content = message.text or message.caption
-    if text_content:
-        if settings.get("text", True): return True
-        if any(tag in text_content for tag in settings.get("allowed_hashtags", [])): return True
-        if any(domain in text_content for domain in settings.get("allowed_links", [])): return True
-    return False
-
-async def handle_tag_settings(callback: CallbackQuery, state: FSMContext, tag_type: str, title: str, empty_msg: str):
-    data = await state.get_data()
-    group_id = data.get("selected_group")
-    topic_id = data.get("selected_topic")
+async def menu_session(user_id: int, bot: Bot) -> Optional[AdminSession]:
+    # группа изменилась с прошлого шага меню — заново проверяем, что пользователь всё ещё админ
+    session = await sessions.get(user_id)
+    if session is None or session.group is None:
+        return session
+    if ensure_group(session.group) is None:
+        return None
+    version = group_versions[session.group]
+    if session.version != version:
+        try:
+            if not await admin_cache.is_admin(bot, int(session.group), user_id):
+                return None
+        except Exception as e:
+            logging.error(f"Ошибка проверки администратора: {e}")
+            return None
+        await sessions.update(session, version=version)
+    return session
+
+async def group_access(user_id: int, bot: Bot, group_id: str) -> bool:
+    # группа из callback_data должна быть выбрана в сессии: кнопку из чужого или старого меню не принимаем
+    session = await menu_session(user_id, bot)
+    return session is not None and session.group == group_id
+
+async def selection(user_id: int, bot: Bot) -> Tuple[Optional[str], Optional[str]]: #выбранные группа и топик
+    session = await menu_session(user_id, bot)
+    if session is None or session.topic not in group_settings.get(session.group, {}).get("topics", {}):
+        return (session.group, None) if session else (None, None)
+    return session.group, session.topic
+
+async def handle_tag_settings(callback: CallbackQuery, bot: Bot, tag_type: str, title: str, empty_msg: str):
+    group_id, topic_id = await selection(callback.from_user.id, bot)
     if not (group_id and topic_id):
         await callback.answer("Ошибка: топик не выбран", show_alert=True)
         return
@@ -202,39 +349,36 @@ async def handle_tag_settings(callback: CallbackQuery, state: FSMContext, tag_ty
 @router.message(Command("botconfig"))
 async def cmd_botconfig(message: Message, bot: Bot, state: FSMContext):
     user, chat = message.from_user, message.chat
-    await state.update_data(user_id=user.id, chat_type=chat.type)
     if chat.type == "private":
-        allowed_groups = {}
-        for gid, gdata in group_settings.items():
-            try:
-                if "admins" not in gdata:
-                    admins = await bot.get_chat_administrators(int(gid))
-                    gdata["admins"] = [admin.user.id for admin in admins]
-                    save_config({"api_token": token, "group_settings": group_settings})
-                if user.id in gdata.get("admins", []):
-                    allowed_groups[gid] = gdata
-            except Exception as e:
-                logging.error(f"Ошибка группы {gid}: {e}")
+        allowed_groups = []
+        candidates = admin_group_candidates(user.id)
+        results = await asyncio.gather(
+            *(admin_cache.is_admin(bot, int(gid), user.id) for gid in candidates),
+            return_exceptions=True)
+        for gid, result in zip(candidates, results):
+            if isinstance(result, Exception):
+                logging.error(f"Ошибка группы {gid}: {result}")
+            elif result:
+                allowed_groups.append(gid)
         if not allowed_groups:
             await message.answer("⚠️ Вы не администратор ни в одной группе.")
             return
-        await state.update_data(allowed_groups=allowed_groups)
-        await message.answer("Выберите группу:", reply_markup=groups_menu_keyboard(allowed_groups))
+        await sessions.start(user.id, tuple(allowed_groups), 0)
+        await message.answer("Выберите группу:", reply_markup=groups_menu_keyboard(tuple(allowed_groups)))
         await state.set_state(ConfigStates.GROUP_SELECTION)
     else:
         if not await check_admin(message, bot):
             await message.answer("⚠️ Только администраторы могут использовать эту команду.")
             return
         group_id = str(chat.id)
-        if group_id not in group_settings:
+        if ensure_group(group_id) is None:
             group_settings[group_id] = {"name": chat.title or group_id, "topics": {}}
             try:
-                admins = await bot.get_chat_administrators(chat.id)
-                group_settings[group_id]["admins"] = [admin.user.id for admin in admins]
-                save_config({"api_token": token, "group_settings": group_settings})
+                sync_admins(chat.id, await admin_cache.get(bot, chat.id))
             except Exception as e:
                 logging.error(f"Ошибка получения администраторов: {e}")
-        await state.update_data(selected_group=group_id)
+        # сессия по пользователю, а не по чату: меню дальше живёт в ЛС
+        await sessions.start(user.id, (group_id,), group_versions[group_id], group=group_id)
         try:
             await bot.send_message(user.id, "Выберите раздел:", reply_markup=main_menu_keyboard())
             await message.answer("✅ Конфигурация отправлена в ЛС.")
@@ -257,7 +401,7 @@ async def cmd_addtopic(message: Message, bot: Bot):
     topic_name = parts[1].strip()
     group_id = str(message.chat.id)
     topic_id = str(message.message_thread_id) if message.message_thread_id else "0"
-    if group_id not in group_settings:
+    if ensure_group(group_id) is None:
         group_settings[group_id] = {"name": message.chat.title or group_id, "topics": {}}
     if topic_id in group_settings[group_id].get("topics", {}):
         await message.answer("⚠️ Топик с таким ID уже существует.")
@@ -265,7 +409,7 @@ async def cmd_addtopic(message: Message, bot: Bot):
     new_topic = dict(DEFAULT_TOPIC_SETTINGS)
     new_topic["name"] = topic_name
     group_settings[group_id]["topics"][topic_id] = new_topic
-    save_config({"api_token": token, "group_settings": group_settings})
+    save_settings(group_id, topic_id)
     await message.answer(f"✅ Топик «{topic_name}» добавлен")
 
 @router.message(Command("deltopic"))
@@ -277,9 +421,11 @@ async def cmd_deltopic(message: Message, bot: Bot):
         await message.answer("⚠️ Только администраторы могут использовать эту команду.")
         return
     group_id = str(message.chat.id)
-    if group_id not in group_settings or not group_settings[group_id].get("topics"):
+    if ensure_group(group_id) is None or not group_settings[group_id].get("topics"):
         await message.answer("⚠️ В этой группе нет топиков для удаления.")
         return
+    # меню удаления в ЛС проверяется по этой сессии, как и /botconfig
+    await sessions.start(message.from_user.id, (group_id,), group_versions[group_id], group=group_id)
     try:
         await bot.send_message(
             message.from_user.id,
@@ -302,14 +448,17 @@ async def show_commands(message: Message):
     await message.answer(commands_text)
 
 @router.callback_query(F.data.startswith("group_"))
-async def group_selected(callback: CallbackQuery, state: FSMContext):
+async def group_selected(callback: CallbackQuery, bot: Bot, state: FSMContext):
     print(callback.data)
     group_id = callback.data.split("_", 1)[1]
-    data = await state.get_data()
-    if group_id not in data.get("allowed_groups", {}):
+    session = await sessions.get(callback.from_user.id)
+    if session is None or group_id not in session.groups or ensure_group(group_id) is None:
+        await callback.answer("⚠️ Доступ запрещен", show_alert=True)
+        return
+    await sessions.update(session, group=group_id, topic=None, version=-1)
+    if await menu_session(callback.from_user.id, bot) is None:
         await callback.answer("⚠️ Доступ запрещен", show_alert=True)
         return
-    await state.update_data(selected_group=group_id)
     group_name = group_settings[group_id]['name']
     await callback.message.edit_text(
         f"Группа: {group_name}\nСписок топиков:",
@@ -318,14 +467,14 @@ async def group_selected(callback: CallbackQuery, state: FSMContext):
     await state.set_state(ConfigStates.TOPIC_SELECTION)
 
 @router.callback_query(F.data.startswith("topic_"), ConfigStates.TOPIC_SELECTION)
-async def topic_selected(callback: CallbackQuery, state: FSMContext):
+async def topic_selected(callback: CallbackQuery, bot: Bot, state: FSMContext):
     topic_id = callback.data.split("_", 1)[1]
-    data = await state.get_data()
-    group_id = data.get("selected_group")
+    session = await menu_session(callback.from_user.id, bot)
+    group_id = session.group if session else None
     if not group_id:
         await callback.answer("Ошибка: группа не выбрана", show_alert=True)
         return
-    await state.update_data(selected_topic=topic_id)
+    await sessions.update(session, topic=topic_id)
     topic = group_settings[group_id]["topics"].get(topic_id, {})
     await callback.message.edit_text(
         f"Настройки топика: {topic.get('name', topic_id)}",
@@ -334,10 +483,8 @@ async def topic_selected(callback: CallbackQuery, state: FSMContext):
     await state.set_state(ConfigStates.TOPIC_OPTIONS)
 
 @router.callback_query(F.data == "back_to_topic_options")
-async def back_to_topic_options(callback: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    group_id = data.get("selected_group")
-    topic_id = data.get("selected_topic")
+async def back_to_topic_options(callback: CallbackQuery, bot: Bot, state: FSMContext):
+    group_id, topic_id = await selection(callback.from_user.id, bot)
     if not (group_id and topic_id):
         await callback.answer("Ошибка: топик не выбран", show_alert=True)
         return
@@ -349,10 +496,8 @@ async def back_to_topic_options(callback: CallbackQuery, state: FSMContext):
     await state.set_state(ConfigStates.TOPIC_OPTIONS)
 
 @router.callback_query(F.data == "manual_config", ConfigStates.TOPIC_OPTIONS)
-async def content_settings_menu(callback: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    group_id = data.get("selected_group")
-    topic_id = data.get("selected_topic")
+async def content_settings_menu(callback: CallbackQuery, bot: Bot, state: FSMContext):
+    group_id, topic_id = await selection(callback.from_user.id, bot)
     if not (group_id and topic_id):
         await callback.answer("Ошибка: топик не выбран", show_alert=True)
         return
@@ -364,10 +509,11 @@ async def content_settings_menu(callback: CallbackQuery, state: FSMContext):
     await state.set_state(ConfigStates.CONTENT_CONFIG)
 
 @router.callback_query(F.data == "advanced_settings", ConfigStates.TOPIC_OPTIONS)
-async def show_advanced_settings(callback: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    group_id = data.get("selected_group")
-    topic_id = data.get("selected_topic")
+async def show_advanced_settings(callback: CallbackQuery, bot: Bot, state: FSMContext):
+    group_id, topic_id = await selection(callback.from_user.id, bot)
+    if not (group_id and topic_id):
+        await callback.answer("Ошибка: топик не выбран", show_alert=True)
+        return
     topic = group_settings[group_id]["topics"][topic_id]
     await callback.message.edit_text(
         "⚙️ Дополнительные настройки топика:",
@@ -375,14 +521,15 @@ async def show_advanced_settings(callback: CallbackQuery, state: FSMContext):
     )
 
 @router.callback_query(F.data.startswith("toggle_"))
-async def toggle_content_setting(callback: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    group_id = data.get("selected_group")
-    topic_id = data.get("selected_topic")
+async def toggle_content_setting(callback: CallbackQuery, bot: Bot, state: FSMContext):
+    group_id, topic_id = await selection(callback.from_user.id, bot)
+    if not (group_id and topic_id):
+        await callback.answer("Ошибка: топик не выбран", show_alert=True)
+        return
     setting = "_".join(callback.data.split("_")[1:])
     current = group_settings[group_id]["topics"][topic_id].get(setting, False)
     group_settings[group_id]["topics"][topic_id][setting] = not current
-    save_config({"api_token": token, "group_settings": group_settings})
+    save_settings(group_id, topic_id)
     if setting in ["content_tracking", "is_general", "forward_mentions"]:
         await callback.message.edit_text(
             "⚙️ Дополнительные настройки топика:",
@@ -393,10 +540,8 @@ async def toggle_content_setting(callback: CallbackQuery, state: FSMContext):
             reply_markup=content_settings_keyboard(group_settings[group_id]["topics"][topic_id]))
 
 @router.callback_query(F.data == "configure_forward", ConfigStates.TOPIC_OPTIONS)
-async def forward_settings_menu(callback: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    group_id = data.get("selected_group")
-    topic_id = data.get("selected_topic")
+async def forward_settings_menu(callback: CallbackQuery, bot: Bot, state: FSMContext):
+    group_id, topic_id = await selection(callback.from_user.id, bot)
     if not (group_id and topic_id):
         await callback.answer("Ошибка: топик не выбран", show_alert=True)
         return
@@ -409,11 +554,9 @@ async def forward_settings_menu(callback: CallbackQuery, state: FSMContext):
     await state.set_state(ConfigStates.FORWARD_CONFIG)
 
 @router.callback_query(F.data.startswith("forward_toggle_"), ConfigStates.FORWARD_CONFIG)
-async def toggle_forward_topic(callback: CallbackQuery, state: FSMContext):
+async def toggle_forward_topic(callback: CallbackQuery, bot: Bot, state: FSMContext):
     target_id = callback.data.split("_", 2)[2]
-    data = await state.get_data()
-    group_id = data.get("selected_group")
-    topic_id = data.get("selected_topic")
+    group_id, topic_id = await selection(callback.from_user.id, bot)
     if not (group_id and topic_id):
         await callback.answer("Ошибка: топик не выбран", show_alert=True)
         return
@@ -424,14 +567,16 @@ async def toggle_forward_topic(callback: CallbackQuery, state: FSMContext):
     else:
         current.append(target_id)
     topic["forward_to_topics"] = current
-    save_config({"api_token": token, "group_settings": group_settings})
+    save_settings(group_id, topic_id)
+    # меняется одна кнопка на текущей странице — правим только её
+    markup = toggle_button(callback.message.reply_markup, callback.data, target_id in current)
     await callback.message.edit_reply_markup(
-        reply_markup=forward_settings_keyboard(group_id, topic_id, current))
+        reply_markup=markup or forward_settings_keyboard(group_id, topic_id, current))
 
 @router.callback_query(F.data == "edit_hashtags", ConfigStates.TOPIC_OPTIONS)
-async def hashtags_settings_menu(callback: CallbackQuery, state: FSMContext):
+async def hashtags_settings_menu(callback: CallbackQuery, bot: Bot):
     await handle_tag_settings(
-        callback, state,
+        callback, bot,
         tag_type="hashtags",
         title="Текущие хэштеги",
         empty_msg="Хэштеги не добавлены"
@@ -448,9 +593,9 @@ async def request_hashtags_input(callback: CallbackQuery, state: FSMContext):
     await state.set_state(ConfigStates.HASHTAGS_INPUT)
 
 @router.callback_query(F.data == "edit_links", ConfigStates.TOPIC_OPTIONS)
-async def domains_settings_menu(callback: CallbackQuery, state: FSMContext):
+async def domains_settings_menu(callback: CallbackQuery, bot: Bot):
     await handle_tag_settings(
-        callback, state,
+        callback, bot,
         tag_type="links",
         title="Текущие разрешенные ссылки",
         empty_msg="Ссылки не добавлены"
@@ -467,10 +612,8 @@ async def request_domains_input(callback: CallbackQuery, state: FSMContext):
     await state.set_state(ConfigStates.DOMAINS_INPUT)
 
 @router.message(StateFilter(ConfigStates.HASHTAGS_INPUT, ConfigStates.DOMAINS_INPUT))
-async def save_tags(message: Message, state: FSMContext):
-    data = await state.get_data()
-    group_id = data.get("selected_group")
-    topic_id = data.get("selected_topic")
+async def save_tags(message: Message, bot: Bot, state: FSMContext):
+    group_id, topic_id = await selection(message.from_user.id, bot)
     if not (group_id and topic_id):
         await message.answer("Ошибка: топик не выбран")
         return
@@ -478,7 +621,7 @@ async def save_tags(message: Message, state: FSMContext):
     back_cmd = f"edit_{tag_type}"
     new_tags = message.text.strip().split()
     group_settings[group_id]["topics"][topic_id][f"allowed_{tag_type}"] = new_tags
-    save_config({"api_token": token, "group_settings": group_settings})
+    save_settings(group_id, topic_id)
     text = "Хэштеги" if tag_type == "hashtags" else "Ссылки"
     await message.answer(
         f"{text} обновлены:\n```\n{' '.join(new_tags)}\n```",
@@ -489,10 +632,46 @@ async def save_tags(message: Message, state: FSMContext):
     )
     await state.set_state(ConfigStates.TOPIC_OPTIONS)
 
+@router.callback_query(F.data.startswith("page_"))
+async def change_page(callback: CallbackQuery, bot: Bot):
+    _, view, page, *rest = callback.data.split("_", 3)
+    page = int(page)
+    if view == "d":
+        group_id = rest[0]
+        if not await group_access(callback.from_user.id, bot, group_id):
+            await callback.answer("⚠️ Доступ запрещен", show_alert=True)
+            return
+        markup = delete_topic_menu_keyboard(group_id, page)
+    elif view == "g":
+        session = await sessions.get(callback.from_user.id)
+        markup = groups_menu_keyboard(session.groups if session else (), page)
+    else:
+        group_id, topic_id = await selection(callback.from_user.id, bot)
+        if not group_id or (view == "f" and not topic_id):
+            await callback.answer("Ошибка: группа не выбрана", show_alert=True)
+            return
+        if view == "t":
+            markup = group_topics_keyboard(group_id, page)
+        else:
+            topic = group_settings[group_id]["topics"][topic_id]
+            markup = forward_settings_keyboard(group_id, topic_id, topic.get("forward_to_topics", []), page)
+    await callback.message.edit_reply_markup(reply_markup=markup)
+
+@router.callback_query(F.data.startswith("del_topics_"))
+async def delete_topics_menu(callback: CallbackQuery, bot: Bot):
+    group_id = callback.data.split("_", 2)[2]
+    if not await group_access(callback.from_user.id, bot, group_id):
+        await callback.answer("⚠️ Доступ запрещен", show_alert=True)
+        return
+    await callback.message.edit_text("Выберите топик для удаления:", reply_markup=delete_topic_menu_keyboard(group_id))
+
 @router.callback_query(F.data.startswith("confirm_delete_"))
-async def confirm_topic_delete(callback: CallbackQuery):
+async def confirm_topic_delete(callback: CallbackQuery, bot: Bot):
     _, __, topic_id, group_id = callback.data.split("_")
-    if group_id not in group_settings or topic_id not in group_settings[group_id].get("topics", {}):
+    if not await group_access(callback.from_user.id, bot, group_id):
+        await callback.answer("⚠️ Доступ запрещен", show_alert=True)
+        return
+    if topic_id not in group_settings[group_id].get("topics", {}):
         await callback.answer("⚠️ Топик не найден", show_alert=True)
         return
     topic_name = group_settings[group_id]["topics"][topic_id].get("name", topic_id)
@@ -502,13 +681,19 @@ async def confirm_topic_delete(callback: CallbackQuery):
     )
 
 @router.callback_query(F.data.startswith("yes_delete_"))
-async def delete_topic(callback: CallbackQuery):
+async def delete_topic(callback: CallbackQuery, bot: Bot):
     _, __, topic_id, group_id = callback.data.split("_")
-    topic = group_settings[group_id]["topics"].get(topic_id, {})
+    if not await group_access(callback.from_user.id, bot, group_id):
+        await callback.answer("⚠️ Доступ запрещен", show_alert=True)
+        return
+    if topic_id not in group_settings[group_id].get("topics", {}):
+        await callback.answer("⚠️ Топик не найден", show_alert=True)
+        return
+    topic = group_settings[group_id]["topics"][topic_id]
     topic_name = topic.get("name", topic_id)
     group_name = group_settings[group_id].get("name", group_id)
     del group_settings[group_id]["topics"][topic_id]
-    save_config({"api_token": token, "group_settings": group_settings})
+    save_settings(group_id, topic_id)
     await callback.message.edit_text(
         f"🗑️ Топик «{topic_name}» удалён из группы «{group_name}».",
         reply_markup=InlineKeyboardMarkup(
@@ -523,10 +708,10 @@ async def back_to_main_menu(callback: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data == "main_groups")
 async def back_to_groups(callback: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
+    session = await sessions.get(callback.from_user.id)
     await callback.message.edit_text(
         "Выберите группу для настройки:",
-        reply_markup=groups_menu_keyboard(data.get("allowed_groups", {}))
+        reply_markup=groups_menu_keyboard(session.groups if session else ())
     )
     await state.set_state(ConfigStates.GROUP_SELECTION)
 
@@ -542,54 +727,137 @@ async def show_commands_callback(callback: CallbackQuery):
     )
     await callback.message.edit_text(commands_text)
 
+@router.chat_member()
+async def on_chat_member(update: ChatMemberUpdated):
+    member = update.new_chat_member
+    is_admin = member.status in ADMIN_STATUSES
+    admin_cache.update_member(update.chat.id, member.user.id, is_admin)
+    gdata = group_settings.get(str(update.chat.id))
+    if gdata is not None and "admins" in gdata and (member.user.id in gdata["admins"]) != is_admin:
+        admins = set(gdata["admins"])
+        if is_admin:
+            admins.add(member.user.id)
+        else:
+            admins.discard(member.user.id)
+        sync_admins(update.chat.id, admins)
+
+@router.my_chat_member()
+async def on_my_chat_member(update: ChatMemberUpdated):
+    admin_cache.invalidate(update.chat.id)
+
 @router.message(F.chat.type.in_(["group", "supergroup"]))
 async def check_content(message: Message, bot: Bot):
-    group_id = str(message.chat.id)
-    is_general_reply = (
-        message.is_topic_message is None and 
-        message.reply_to_message is not None
-    )
-    topic_id = "default" if is_general_reply else str(message.message_thread_id or "default")
-    settings = group_settings.get(group_id, {}).get("topics", {}).get(topic_id)
-    if not settings and is_general_reply:
-        settings = group_settings.get(group_id, {}).get("topics", {}).get("default")
-    if not settings or not settings.get("content_tracking", False):
+    started = perf_counter()
+    thread_id = message_thread(message)
+    if message.chat.id not in loaded_chats:
+        ensure_group(str(message.chat.id))
+    rule = rules.get(message.chat.id, thread_id)
+    if not rule:
+        return
+    if rule.flood_limit and message.from_user and not albums.collecting(message):
+        if await check_flood(message, bot, rule, thread_id, started):
+            return
+    if rule.duplicate_window and message.from_user and duplicates.check(message, rule.duplicate_window):
+        # повтор удаляется без поиска автора и пересылок
+        if not await is_exempt(bot, message):
+            metrics.inc("bot_messages_total", chat=message.chat.id, topic=rule.topic_id, outcome="duplicate")
+            deleter.schedule(bot, message.chat.id, message.message_id, rule.topic_id)
+            audit_decision([message], rule, "duplicate", ["delete"], started)
+            return
+    if not rule.content_tracking:
         return
-    if is_content_allowed(message, settings):
+    if message.media_group_id:
+        # части альбома разбираются вместе, когда придут все
+        albums.add(message, lambda parts: moderate(parts, bot, rule, perf_counter()))
+        return
+    await moderate([message], bot, rule, started)
+
+def audit_decision(messages: List[Message], rule: TopicRule, reason: str, actions: List[str], started: float):
+    # одна запись на сообщение: по чату и message_id видно, почему его удалили
+    if not audit.path:
         return
+    latency_ms = round((perf_counter() - started) * 1000, 3)
+    now = time()
+    for message in messages:
+        audit.record(
+            chat=message.chat.id, topic=rule.topic_id, user=message.from_user.id if message.from_user else None,
+            message_id=message.message_id, content_type=message.content_type, rule=reason, actions=actions,
+            latency_ms=latency_ms, delay_s=round(now - message.date.timestamp(), 3))
+
+async def is_exempt(bot: Bot, message: Message) -> bool: #админ группы; если список админов не получить, не освобождаем
+    if message.sender_chat and message.sender_chat.id == message.chat.id:
+        # анонимный админ пишет от имени самой группы
+        return True
     try:
-        user_id = message.reply_to_message.from_user.id
-        chat_member = await bot.get_chat_member(int(group_id), user_id)
-        author = chat_member.user
-        mention = f"@{author.username}" if author.username else f'<a href="tg://user?id={author.id}">{author.first_name}</a>'
+        return await admin_cache.is_admin(bot, message.chat.id, message.from_user.id)
     except Exception as e:
-        logging.error(f"Ошибка получения информации об авторе: {e}")
-        mention = ""
-    for target_id in settings.get("forward_to_topics", []):
+        logging.error(f"Ошибка проверки администратора в чате {message.chat.id}: {e}")
+        return False
+
+async def check_flood(message: Message, bot: Bot, rule: TopicRule, thread_id: int, started: float) -> bool: #True, если сообщение удалено как флуд
+    # у постов от имени канала и анонимных админов from_user общий служебный бот: считаем по sender_chat
+    sender_id = message.sender_chat.id if message.sender_chat else message.from_user.id
+    verdict = flood.hit(flood_key(message.chat.id, thread_id, sender_id), rule.flood_limit,
+                        rule.flood_window, message.date.timestamp())
+    if verdict == OK:
+        return False
+    # админов проверяем только при превышении, обычно ответ уже в кеше
+    if await is_exempt(bot, message):
+        return False
+    metrics.inc("bot_messages_total", chat=message.chat.id, topic=rule.topic_id, outcome="flood")
+    deleter.schedule(bot, message.chat.id, message.message_id, rule.topic_id)
+    actions = ["delete"]
+    if verdict == OFFENCE and rule.flood_mute and not message.sender_chat:
+        # ограничить можно только пользователя; посты от имени канала просто удаляются
         try:
-            thread_id = None if target_id == "default" else int(target_id)
-            if message.reply_to_message:
-                await bot.forward_message(
-                    chat_id=int(group_id),
-                    from_chat_id=int(group_id),
-                    message_id=message.reply_to_message.message_id,
-                    message_thread_id=thread_id
-                )
-            if mention and settings.get("forward_mentions", False):
-                await bot.send_message(
-                    int(group_id), mention,
-                    parse_mode="HTML",
-                    message_thread_id=thread_id
-                )
-            await bot.forward_message(
-                chat_id=int(group_id),
-                from_chat_id=int(group_id),
-                message_id=message.message_id,
-                message_thread_id=thread_id
-            )
+            await bot.restrict_chat_member(
+                message.chat.id, message.from_user.id, ChatPermissions(can_send_messages=False),
+                # меньше 30 с от текущего момента Telegram считает ограничением навсегда
+                until_date=datetime.now(timezone.utc) + timedelta(seconds=max(rule.flood_window, 60)))
+            actions.append("mute")
         except Exception as e:
-            logging.error(f"Ошибка пересылки: {e}")
-    try:
-        await message.delete()
-    except Exception as e:
-        logging.error(f"Ошибка удаления сообщения: {e}")
\ No newline at end of file
+            logging.error(f"Ошибка ограничения пользователя {message.from_user.id}: {e}")
+    audit_decision([message], rule, "flood", actions, started)
+    return True
+
+async def moderate(messages: List[Message], bot: Bot, rule: TopicRule, started: float): #проверка сообщения или альбома целиком
+    message = messages[0]
+    chat_label = message.chat.id
+    allowed = is_content_allowed(message, rule) if len(messages) == 1 else is_album_allowed(messages, rule)
+    if allowed:
+        metrics.inc("bot_messages_total", len(messages), chat=chat_label, topic=rule.topic_id, outcome="allowed")
+        return
+    metrics.inc("bot_messages_total", len(messages), chat=chat_label, topic=rule.topic_id, outcome="violating")
+    reason = "album" if len(messages) > 1 else "content"
+    mention = sender_mention(message.reply_to_message) if message.reply_to_message else ""
+    forwards = None
+    if rule.forward_to:
+        if (rule.digest_window and digests.accepts(chat_label, rule.topic_id, rule.digest_window, rule.digest_threshold)
+                or not gateway.reserve(chat_label, len(rule.forward_to))):
+            # наплыв нарушений или исчерпан лимит отправки в чат: пересылка, сводка и удаление —
+            # одним заходом по окончании окна; сводка дождётся лимита сама, нарушение не теряется
+            offender = sender_mention(message) or str(chat_label)
+            digests.add(bot, messages, rule.forward_to, rule.digest_window or DIGEST_WINDOW, rule.topic_id,
+                        offender, mention if rule.forward_mentions else "")
+            audit_decision(messages, rule, reason, ["digest", "delete"], started)
+            return
+        # сеть не держит очередь чата: пересылки идут фоном с уже взятыми токенами чата
+        forwards = fanout.spawn(forward_violation(bot, messages, rule.forward_to))
+    for part in messages:
+        deleter.schedule(bot, chat_label, part.message_id, rule.topic_id, after=forwards)
+    if forwards is None:
+        audit_decision(messages, rule, reason, ["delete"], started)
+        return
+    fanout.spawn(report_forwards(forwards, bot, messages, rule, mention if rule.forward_mentions else "", reason, started))
+
+async def report_forwards(forwards: asyncio.Task, bot: Bot, messages: List[Message], rule: TopicRule,
+                          mention: str, reason: str, started: float): #упоминания, метрики и аудит после пересылок
+    chat_label = messages[0].chat.id
+    forwarded = await forwards
+    if forwarded:
+        metrics.inc("bot_messages_total", forwarded, chat=chat_label, topic=rule.topic_id, outcome="forwarded")
+    actions = [f"forward:{forwarded}/{len(rule.forward_to)}", "delete"]
+    if mention:
+        await send_mentions(bot, chat_label, rule.forward_to, gateway, mention)
+        actions.append("mention")
+    audit_decision(messages, rule, reason, actions, started)
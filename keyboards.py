@@ -0,0 +1,52 @@
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+PAGE_SIZE = 20  # у Telegram не больше 100 кнопок в клавиатуре
+MAX_KEYBOARDS = 1024
+SELECTED, UNSELECTED = "✅", "❌"
+
+class KeyboardCache:
+    # готовые клавиатуры по (вид, группа, версия конфига, страница); новая версия просто даёт новый ключ
+    def __init__(self, max_entries: int = MAX_KEYBOARDS):
+        self.max_entries = max_entries
+        self._markups: "OrderedDict[Hashable, InlineKeyboardMarkup]" = OrderedDict()
+
+    def get(self, key: Hashable, build: Callable[[], InlineKeyboardMarkup]) -> InlineKeyboardMarkup:
+        markup = self._markups.get(key)
+        if markup is None:
+            markup = self._markups[key] = build()
+            if len(self._markups) > self.max_entries:
+                self._markups.popitem(last=False)
+        else:
+            self._markups.move_to_end(key)
+        return markup
+
+def paginate(rows: List[List[InlineKeyboardButton]], page: int, view: str,
+             suffix: str = "") -> List[List[InlineKeyboardButton]]:
+    # одна страница строк и навигация; callback_data: page_<вид>_<страница>[_<группа>]
+    pages = max(1, -(-len(rows) // PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    visible = rows[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+    if pages > 1:
+        tail = f"_{suffix}" if suffix else ""
+        nav = []
+        if page > 0:
+            nav.append(InlineKeyboardButton(text=f"◀️ {page}/{pages}", callback_data=f"page_{view}_{page - 1}{tail}"))
+        if page < pages - 1:
+            nav.append(InlineKeyboardButton(text=f"{page + 2}/{pages} ▶️", callback_data=f"page_{view}_{page + 1}{tail}"))
+        visible.append(nav)
+    return visible
+
+def toggle_button(markup: Optional[InlineKeyboardMarkup], callback_data: str,
+                  selected: bool) -> Optional[InlineKeyboardMarkup]:
+    # переключает отметку одной кнопки в уже показанной клавиатуре, не перебирая топики заново
+    if markup is None:
+        return None
+    for y, row in enumerate(markup.inline_keyboard):
+        for x, button in enumerate(row):
+            if button.callback_data == callback_data and button.text[-1:] in (SELECTED, UNSELECTED):
+                rows = [list(r) for r in markup.inline_keyboard]
+                rows[y][x] = button.model_copy(update={"text": button.text[:-1] + (SELECTED if selected else UNSELECTED)})
+                return InlineKeyboardMarkup(inline_keyboard=rows)
+    return None
@@ -0,0 +1,75 @@
+from typing import Iterable, Iterator, Optional
+from urllib.parse import urlsplit
+from aiogram.enums import MessageEntityType
+from aiogram.types import Message
+
+_END = ""
+
+def normalize_host(raw: str) -> Optional[str]:
+    raw = raw.strip()
+    if not raw:
+        return None
+    if "://" not in raw:
+        raw = f"http://{raw}"
+    try:
+        host = urlsplit(raw).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    host = host.rstrip(".")
+    if not host.isascii():
+        try:
+            host = host.encode("idna").decode("ascii")
+        except UnicodeError:
+            return None
+    if host.startswith("www."):
+        host = host[4:]
+    return host or None
+
+def message_hosts(message: Message) -> Iterator[str]:
+    text = message.text or message.caption
+    entities = message.entities if message.text else message.caption_entities
+    for entity in entities or ():
+        if entity.type == MessageEntityType.URL:
+            host = normalize_host(entity.extract_from(text))
+        elif entity.type == MessageEntityType.TEXT_LINK:
+            host = normalize_host(entity.url or "")
+        else:
+            continue
+        if host:
+            yield host
+
+class DomainIndex:
+    # префиксное дерево по меткам домена в обратном порядке: com -> example -> ...
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, domains: Iterable[str] = ()):
+        self._root = {}
+        self._size = 0
+        for domain in domains:
+            self.add(domain)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, domain: str):
+        host = normalize_host(domain)
+        if not host:
+            return
+        node = self._root
+        for label in reversed(host.split(".")):
+            node = node.setdefault(label, {})
+        if _END not in node:
+            node[_END] = True
+            self._size += 1
+
+    def match(self, host: str) -> bool:
+        node = self._root
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
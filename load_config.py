@@ -1,11 +1,87 @@
+import asyncio
 import json
+import logging
+import os
+import stat
+import tempfile
+from typing import Callable, Optional
 
 SAVE_FILE = "bot_data.json"
+SAVE_DELAY = 1.0
 
 def load_config() -> dict: #загрузка конфига
     with open(SAVE_FILE,"r",encoding="utf-8") as f:
         return json.load(f)
 
+def write_atomic(path: str, data: str): #запись через временный файл, fsync и rename
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".bot_data.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp создаёт файл с правами 0600 — оставляем права прежнего файла
+        if os.path.exists(path):
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 def save_config(config): #его сохранение
-    with open(SAVE_FILE,"w",encoding="utf-8") as f:
-        json.dump(config,f,ensure_ascii=False,indent=4)
\ No newline at end of file
+    write_atomic(SAVE_FILE, json.dumps(config,ensure_ascii=False,indent=4))
+
+class ConfigSaver:
+    # отложенная запись: серия правок за SAVE_DELAY сохраняется одной записью в отдельном потоке
+    def __init__(self, get_config: Callable[[], dict], delay: float = SAVE_DELAY, path: str = SAVE_FILE):
+        self.get_config = get_config
+        self.delay = delay
+        self.path = path
+        self._dirty = False
+        self._task = None
+        self._flushing = asyncio.Event()
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def mark_dirty(self, group_id: Optional[str] = None, topic_id: Optional[str] = None):
+        # JSON переписывается целиком, ключи нужны только построчным хранилищам
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self._dirty:
+            try:
+                await asyncio.wait_for(self._flushing.wait(), self.delay)
+            except asyncio.TimeoutError:
+                pass
+            await self._write()
+
+    async def _write(self):
+        self._dirty = False
+        try:
+            data = await asyncio.to_thread(json.dumps, self.get_config(), ensure_ascii=False, indent=4)
+            await asyncio.to_thread(write_atomic, self.path, data)
+        except RuntimeError:
+            # конфиг изменился во время сериализации — повторим на следующем круге
+            self._dirty = True
+        except Exception as e:
+            logging.error(f"Ошибка сохранения конфига: {e}")
+            self._dirty = True
+            await asyncio.sleep(self.delay)
+
+    async def flush(self):
+        self._flushing.set()
+        try:
+            if self._task is not None and not self._task.done():
+                try:
+                    await asyncio.wait_for(self._task, self.delay * 5)
+                except (asyncio.TimeoutError, asyncio.CancelledError):
+                    pass
+            if self._dirty:
+                await self._write()
+        finally:
+            self._flushing.clear()
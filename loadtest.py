@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import statistics
+import sys
+import tempfile
+from collections import Counter, deque
+from time import monotonic, time
+from typing import Dict, Iterator, Tuple
+from aiohttp import web
+from aiogram.types import Message
+from benchmark import build_config, build_update
+from replay import DENY, decide
+from rules import RuleSet
+
+# нагрузочный прогон настоящего main.py против локальной заглушки Bot API
+
+API_HOST = "127.0.0.1"
+API_PORT = 8081
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Moderator", "username": "moderator_bot"}
+# служебные методы не тормозим и не отвечаем на них 429
+SERVICE_METHODS = frozenset({"getMe", "getUpdates", "deleteWebhook", "setWebhook", "close", "logOut"})
+
+class FakeBotAPI:
+    # отдаёт сценарий через getUpdates, принимает вызовы модерации и отмечает время каждого удаления
+    def __init__(self, updates: Iterator[dict], rules: RuleSet, rate: float, latency: float = 0.0,
+                 jitter: float = 0.0, retry_rate: float = 0.0, retry_after: int = 1, seed: int = 1):
+        self.updates = updates
+        self.rules = rules
+        self.rate = rate
+        self.latency = latency
+        self.jitter = jitter
+        self.retry_rate = retry_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.pending: deque = deque()
+        self.arrived = asyncio.Event()
+        self.ready = asyncio.Event()
+        self.calls = Counter()
+        self.retries = Counter()
+        self.sent = 0
+        self.expected = set()
+        self.ingested: Dict[Tuple[int, int], float] = {}
+        self.deleted: Dict[Tuple[int, int], float] = {}
+        self.next_message_id = 10_000_000
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def produce(self):
+        # равномерный поток апдейтов с заданной частотой; запрещённое заранее отмечается по тем же правилам
+        started = monotonic()
+        for index, update in enumerate(self.updates):
+            delay = started + index / self.rate - monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update["message"]["date"] = int(time())
+            message = Message.model_validate(update["message"])
+            if decide(self.rules, message)[1] == DENY:
+                self.expected.add((message.chat.id, message.message_id))
+            self.pending.append(update)
+            self.sent += 1
+            self.arrived.set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if method not in SERVICE_METHODS:
+            if self.random.random() < self.retry_rate:
+                self.retries[method] += 1
+                return web.json_response({
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after}})
+            now = monotonic()
+            if method == "deleteMessage":
+                self.deleted.setdefault((int(params["chat_id"]), int(params["message_id"])), now)
+            elif method == "deleteMessages":
+                for message_id in json.loads(params["message_ids"]):
+                    self.deleted.setdefault((int(params["chat_id"]), message_id), now)
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+        if method == "getUpdates":
+            result = await self.get_updates(params)
+        else:
+            result = self.result(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def get_updates(self, params: dict) -> list:
+        self.ready.set()
+        offset = int(params.get("offset", 0))
+        while self.pending and self.pending[0]["update_id"] < offset:
+            self.pending.popleft()
+        if not self.pending:
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), float(params.get("timeout", 0)))
+            except asyncio.TimeoutError:
+                return []
+        batch = []
+        now = monotonic()
+        for update in self.pending:
+            if len(batch) >= int(params.get("limit", 100)):
+                break
+            message = update["message"]
+            self.ingested.setdefault((message["chat"]["id"], message["message_id"]), now)
+            batch.append(update)
+        return batch
+
+    def result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("forwardMessages", "copyMessages"):
+            return [{"message_id": self._message_id()} for _ in json.loads(params["message_ids"])]
+        if method in ("forwardMessage", "sendMessage"):
+            chat_id = int(params["chat_id"])
+            return {"message_id": self._message_id(), "date": int(time()), "text": params.get("text", ""),
+                    "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"}}
+        if method == "getChatMember":
+            return {"status": "member", "user": {"id": int(params["user_id"]), "is_bot": False, "first_name": "user"}}
+        if method == "getChatAdministrators":
+            return [{"status": "creator", "is_anonymous": False,
+                     "user": {"id": 1, "is_bot": False, "first_name": "admin"}}]
+        return True
+
+    def _message_id(self) -> int:
+        self.next_message_id += 1
+        return self.next_message_id
+
+    def report(self, elapsed: float) -> dict:
+        # elapsed — длительность подачи потока; пропускная способность считается до последнего удаления
+        latencies = sorted(self.deleted[key] - self.ingested[key] for key in self.deleted if key in self.ingested)
+        handled = len(self.deleted)
+        span = max(self.deleted.values()) - min(self.ingested.values()) if self.deleted and self.ingested else 0.0
+        api_calls = {method: count for method, count in self.calls.items() if method not in SERVICE_METHODS}
+        def quantile(q: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 1) if latencies else 0.0
+        return {
+            "sent": self.sent,
+            "expected_deletions": len(self.expected),
+            "deleted": handled,
+            "missing": len(self.expected - set(self.deleted)),
+            "unexpected": len(set(self.deleted) - self.expected),
+            "offered_msg_per_s": round(self.sent / elapsed, 1) if elapsed else 0.0,
+            "handled_msg_per_s": round(self.sent / span, 1) if span else 0.0,
+            "ingest_to_delete_ms": {
+                "mean": round(statistics.mean(latencies) * 1000, 1) if latencies else 0.0,
+                "p50": quantile(0.5), "p95": quantile(0.95), "p99": quantile(0.99), "max": quantile(1.0)
+            },
+            "api_calls": api_calls,
+            "api_calls_per_message": round(sum(api_calls.values()) / self.sent, 2) if self.sent else 0.0,
+            "retry_after_injected": dict(self.retries)
+        }
+
+def scripted_updates(config: dict, count: int, domains: int, seed: int) -> Iterator[dict]:
+    rnd = random.Random(seed)
+    for update_id in range(1, count + 1):
+        yield build_update(update_id, config, domains, rnd)
+
+async def run(args) -> dict:
+    rnd = random.Random(args.seed)
+    config = build_config(args.topics, args.domains, rnd)
+    config["api_server"] = f"http://{API_HOST}:{args.port}"
+    config["gateway"] = {"global_rate": args.global_rate, "group_rate": args.group_rate, "group_burst": args.group_burst}
+    rules = RuleSet()
+    rules.rebuild(config["group_settings"])
+    api = FakeBotAPI(scripted_updates(config, args.messages, args.domains, args.seed), rules, args.rate,
+                     args.latency / 1000, args.jitter / 1000, args.retry_rate, args.retry_after, args.seed)
+    runner = web.AppRunner(api.app())
+    await runner.setup()
+    await web.TCPSite(runner, API_HOST, args.port).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "bot_data.json"), "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        output = None if args.verbose else asyncio.subprocess.DEVNULL
+        bot = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py"),
+            cwd=tmp, stdout=output, stderr=output)
+        try:
+            await asyncio.wait_for(api.ready.wait(), 60)
+            started = monotonic()
+            await api.produce()
+            elapsed = monotonic() - started
+            # ждём, пока удалится всё запрещённое или поток удалений не стихнет
+            deadline = monotonic() + args.drain
+            while api.expected - set(api.deleted) and monotonic() < deadline:
+                await asyncio.sleep(0.1)
+        finally:
+            if bot.returncode is None:
+                bot.send_signal(signal.SIGINT)
+                try:
+                    await asyncio.wait_for(bot.wait(), 30)
+                except asyncio.TimeoutError:
+                    bot.kill()
+            await runner.cleanup()
+    return api.report(elapsed)
+
+def print_report(result: dict):
+    latency = result["ingest_to_delete_ms"]
+    print(f"отправлено {result['sent']} ({result['offered_msg_per_s']} msg/s), обработано за "
+          f"{result['handled_msg_per_s']} msg/s, удалено {result['deleted']} "
+          f"из {result['expected_deletions']}, пропущено {result['missing']}, лишних {result['unexpected']}")
+    print(f"от getUpdates до удаления, мс: mean={latency['mean']} p50={latency['p50']} p95={latency['p95']} "
+          f"p99={latency['p99']} max={latency['max']}")
+    print(f"вызовов API на сообщение: {result['api_calls_per_message']}; "
+          + ", ".join(f"{method}={count}" for method, count in sorted(result["api_calls"].items())))
+    if result["retry_after_injected"]:
+        print("выдано 429: " + ", ".join(f"{method}={count}" for method, count in sorted(result["retry_after_injected"].items())))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Прогон main.py против локальной заглушки Bot API")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=500, help="апдейтов в секунду")
+    parser.add_argument("--topics", type=int, default=100)
+    parser.add_argument("--domains", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=20, help="задержка ответа API, мс")
+    parser.add_argument("--jitter", type=float, default=10, help="случайная добавка к задержке, мс")
+    parser.add_argument("--retry-rate", type=float, default=0.0, help="доля вызовов, получающих 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--global-rate", type=float, default=30, help="общий лимит шлюза бота, вызовов/с")
+    parser.add_argument("--group-rate", type=float, default=20 / 60)
+    parser.add_argument("--group-burst", type=int, default=20)
+    parser.add_argument("--drain", type=float, default=60, help="сколько ждать удалений после конца потока, с")
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    parser.add_argument("--verbose", action="store_true", help="показывать вывод бота")
+    arguments = parser.parse_args()
+    outcome = asyncio.run(run(arguments))
+    if arguments.json:
+        print(json.dumps(outcome, ensure_ascii=False, indent=4))
+    else:
+        print_report(outcome)
@@ -0,0 +1,41 @@
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+LOG_FILE = "bot.log"
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+LOG_FORMAT = '[%(asctime)s] %(levelname)s: %(message)s'
+SHARD: Optional[int] = None  # номер воркера шардинга; задаётся до импорта handlers
+
+def log_path(path: str, shard: Optional[int]) -> str: #у каждого воркера свой файл: bot.log -> bot.2.log
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{shard}{ext}"
+
+def setup_logging(settings: dict) -> QueueListener:
+    # цикл событий только кладёт запись в очередь, в консоль и файл пишет отдельный поток;
+    # процессы шардинга не делят один файл: ротация в одном сломала бы запись в остальных
+    formatter = logging.Formatter(LOG_FORMAT)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    file_handler = RotatingFileHandler(
+        log_path(settings.get("path", LOG_FILE), SHARD),
+        maxBytes=settings.get("max_bytes", LOG_MAX_BYTES),
+        backupCount=settings.get("backups", LOG_BACKUPS),
+        encoding="utf-8",
+        delay=True)
+    file_handler.setFormatter(formatter)
+    records = queue.SimpleQueue()
+    logger = logging.getLogger()
+    logger.setLevel(settings.get("level", "INFO"))
+    logger.addHandler(QueueHandler(records))
+    listener = QueueListener(records, stream_handler, file_handler, respect_handler_level=True)
+    listener.start()
+    # при выходе дописываем всё, что осталось в очереди
+    atexit.register(listener.stop)
+    return listener
@@ -1,23 +1,73 @@
 import asyncio
+from typing import Tuple
 from aiogram import Bot, Dispatcher
 from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums.parse_mode import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 import handlers
 from load_config import load_config
+from webhook import run_webhook
+from metrics import ApiMetricsMiddleware, start_metrics_server
+from scheduler import ChatScheduler
+from fsm_storage import create_storage
+from catchup import drain_backlog, feed_updates
 from aiogram.client.default import DefaultBotProperties
 session = AiohttpSession()
 
-async def main():
+async def setup(config: dict) -> Tuple[Bot, Dispatcher]:
+    if config.get("api_server"):
+        # свой Bot API сервер или локальная заглушка из loadtest.py
+        session.api = TelegramAPIServer.from_base(config["api_server"])
+    # шлюз снаружи, метрики внутри: так видно каждую попытку запроса
+    session.middleware(handlers.gateway)
+    session.middleware(ApiMetricsMiddleware())
     # Инициализация баз данных
-    bot = Bot(token=load_config()["api_token"], default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN), session=session)
-    dp = Dispatcher(storage=MemoryStorage())
-    
+    bot = Bot(token=config["api_token"], default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN), session=session)
+    # FSM подключается вручную после планировщика: чтение состояния из общего хранилища
+    # уже идёт в очереди чата и не может переставить апдейты местами
+    dp = Dispatcher(storage=create_storage(config.get("fsm_storage")), disable_fsm=True)
+
     # Подключение middleware
     dp.include_router(handlers.router)
-    
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    scheduler = ChatScheduler(**config.get("scheduler", {}))
+    dp.update.outer_middleware(scheduler)
+    dp["scheduler"] = scheduler
+    dp.update.outer_middleware(dp.fsm)
+    dp.startup.register(handlers.watcher.start)
+    dp.shutdown.register(handlers.watcher.close)
+    dp.shutdown.register(scheduler.join)
+    dp.shutdown.register(handlers.albums.close)
+    dp.shutdown.register(handlers.digests.close)
+    dp.shutdown.register(handlers.fanout.close)
+    dp.shutdown.register(handlers.deleter.close)
+    dp.shutdown.register(handlers.config_saver.flush)
+    dp.shutdown.register(handlers.sessions.close)
+    dp.shutdown.register(handlers.audit.close)
+    if config.get("metrics"):
+        metrics_runner = await start_metrics_server(config["metrics"])
+        dp.shutdown.register(metrics_runner.cleanup)
+    return bot, dp
+
+async def main():
+    config = load_config()
+    if config.get("sharding"):
+        from sharding import run_ingress
+        await run_ingress(config)
+        return
+    bot, dp = await setup(config)
+    catchup = config.get("catchup", True)
+    if config.get("webhook"):
+        await run_webhook(dp, bot, config["webhook"], catchup)
+        return
+    allowed_updates = dp.resolve_used_update_types()
+    if catchup:
+        # сначала разбираем пропущенное за время простоя, потом обычный polling
+        await drain_backlog(bot, allowed_updates, lambda updates: feed_updates(dp, bot, updates),
+                            settle=dp["scheduler"].join)
+    else:
+        await bot.delete_webhook(drop_pending_updates=True)
+    # задача на апдейт живёт, пока очередь чата полна: без предела polling копил бы их без конца
+    await dp.start_polling(bot, allowed_updates=allowed_updates, tasks_concurrency_limit=dp["scheduler"].max_pending)
 
 if __name__ == "__main__":
     asyncio.run(main())
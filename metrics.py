@@ -0,0 +1,141 @@
+import logging
+from bisect import bisect_left
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect_left(BUCKETS, value)
+        if index < len(BUCKETS):
+            self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+class Metrics:
+    # счётчики и гистограммы в памяти, отдаются в текстовом формате Prometheus
+    def __init__(self):
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.gauges: Dict[str, Callable[[], Dict[Labels, float]]] = {}
+        self.help: Dict[str, str] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = tuple(labels.items())
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = tuple(labels.items())
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name: str, collect: Callable[[], Dict[Labels, float]], help_text: str = ""):
+        self.gauges[name] = collect
+        if help_text:
+            self.help[name] = help_text
+
+    def render(self) -> str:
+        lines = []
+        for name, series in self.counters.items():
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{_labels(labels)} {value}" for labels, value in series.items())
+        for name, series in self.histograms.items():
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.total}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        for name, collect in self.gauges.items():
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(f"{name}{_labels(labels)} {value}" for labels, value in collect().items())
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    # время работы каждого обработчика router
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object: HandlerObject = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else type(event).__name__
+        started = perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.observe("bot_handler_seconds", perf_counter() - started, handler=name)
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    # задержка, ошибки и 429 по каждому методу Bot API
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        started = perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            metrics.inc("bot_api_retry_after_total", method=name)
+            raise
+        except Exception:
+            metrics.inc("bot_api_errors_total", method=name)
+            raise
+        finally:
+            metrics.observe("bot_api_request_seconds", perf_counter() - started, method=name)
+
+async def start_metrics_server(settings: dict) -> web.AppRunner:
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    host, port = settings.get("host", METRICS_HOST), settings.get("port", METRICS_PORT)
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
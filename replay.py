@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Iterator, List, Tuple
+from aiogram.types import Message
+from rules import RuleSet, is_content_allowed, message_thread
+
+# прогон записанных апдейтов через те же правила, что и check_content, без обращений к Bot API
+
+CHUNK = 2000
+ALLOW, DENY, SKIP = "allow", "deny", "skip"
+
+_rulesets: List[RuleSet] = []
+
+def load_rules(path: str) -> RuleSet:
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    rules = RuleSet()
+    rules.rebuild(config.get("group_settings", {}))
+    return rules
+
+def _init(paths: List[str]):
+    # правила собираются один раз на процесс, а не на каждую пачку
+    global _rulesets
+    _rulesets = [load_rules(path) for path in paths]
+
+def decide(rules: RuleSet, message: Message) -> Tuple[str, str, int]:
+    # (топик, решение, сколько пересылок сделал бы бот)
+    thread_id = message_thread(message)
+    rule = rules.get(message.chat.id, thread_id)
+    if not rule or not rule.content_tracking:
+        return (rule.topic_id if rule else str(thread_id)), SKIP, 0
+    if is_content_allowed(message, rule):
+        return rule.topic_id, ALLOW, 0
+    return rule.topic_id, DENY, len(rule.forward_to)
+
+def evaluate(lines: List[str]) -> Tuple[Counter, Counter, int]:
+    counts = Counter()  # (конфиг, чат, топик, решение) -> сообщений; решение "forward" — пересылок
+    diff = Counter()    # (чат, топик, было, стало) -> сообщений
+    errors = 0
+    for line in lines:
+        try:
+            payload = json.loads(line)
+            if "update_id" in payload:
+                payload = payload.get("message")
+                if payload is None:
+                    continue
+            message = Message.model_validate(payload)
+        except Exception:
+            errors += 1
+            continue
+        if message.chat.type not in ("group", "supergroup"):
+            continue
+        decisions = [decide(rules, message) for rules in _rulesets]
+        for index, (topic_id, outcome, forwards) in enumerate(decisions):
+            counts[(index, message.chat.id, topic_id, outcome)] += 1
+            if forwards:
+                counts[(index, message.chat.id, topic_id, "forward")] += forwards
+        if len(decisions) == 2 and decisions[0][1] != decisions[1][1]:
+            diff[(message.chat.id, decisions[1][0], decisions[0][1], decisions[1][1])] += 1
+    return counts, diff, errors
+
+def chunks(stream, size: int) -> Iterator[List[str]]:
+    while True:
+        lines = [line for line in islice(stream, size) if line.strip()]
+        if not lines:
+            return
+        yield lines
+
+def replay(stream, paths: List[str], workers: int, chunk: int) -> Tuple[Counter, Counter, int]:
+    # в работе не больше двух пачек на процесс: память не растёт с размером файла
+    totals, diffs, errors = Counter(), Counter(), 0
+    with ProcessPoolExecutor(workers, initializer=_init, initargs=(paths,)) as pool:
+        pending = set()
+
+        def collect(done):
+            nonlocal errors
+            for future in done:
+                counts, diff, failed = future.result()
+                totals.update(counts)
+                diffs.update(diff)
+                errors += failed
+
+        for lines in chunks(stream, chunk):
+            pending.add(pool.submit(evaluate, lines))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(pending).done)
+    return totals, diffs, errors
+
+def report(totals: Counter, diffs: Counter, configs: int) -> dict:
+    topics = {}
+    for (index, chat_id, topic_id, outcome), count in totals.items():
+        key = f"{chat_id}/{topic_id}"
+        topic = topics.setdefault(key, [dict.fromkeys((ALLOW, DENY, "forward", SKIP), 0) for _ in range(configs)])
+        topic[index][outcome] += count
+    changes = {}
+    for (chat_id, topic_id, before, after), count in diffs.items():
+        changes.setdefault(f"{chat_id}/{topic_id}", {})[f"{before}->{after}"] = count
+    return {"topics": topics, "diff": changes}
+
+def print_report(result: dict, configs: int, elapsed: float, errors: int):
+    for key in sorted(result["topics"]):
+        columns = result["topics"][key]
+        line = " | ".join(f"allow={c[ALLOW]:>7} deny={c[DENY]:>7} forward={c['forward']:>7}" for c in columns)
+        if configs == 2:
+            change = result["diff"].get(key)
+            if change:
+                line += "  " + " ".join(f"{name}={count}" for name, count in sorted(change.items()))
+        print(f"{key:>28}  {line}")
+    print(f"{elapsed:.1f} с, ошибок разбора: {errors}", file=sys.stderr)
+
+def main(args):
+    paths = [args.config] + ([args.compare] if args.compare else [])
+    started = time.perf_counter()
+    stream = sys.stdin if args.updates == "-" else open(args.updates, "r", encoding="utf-8")
+    try:
+        totals, diffs, errors = replay(stream, paths, args.workers, args.chunk)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    result = report(totals, diffs, len(paths))
+    if args.json:
+        print(json.dumps({**result, "errors": errors}, ensure_ascii=False, indent=4))
+    else:
+        print_report(result, len(paths), time.perf_counter() - started, errors)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Прогон записанных апдейтов через правила модерации")
+    parser.add_argument("updates", help="JSONL с апдейтами или сообщениями, '-' для stdin")
+    parser.add_argument("--config", default="bot_data.json", help="конфиг, по которому считать решения")
+    parser.add_argument("--compare", help="второй конфиг: посчитать и показать, какие решения изменятся")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=CHUNK, help="строк на одну задачу процесса")
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    main(parser.parse_args())
@@ -0,0 +1,153 @@
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+from aiogram.enums import ContentType, MessageEntityType
+from aiogram.types import Message
+from links import DomainIndex, message_hosts
+
+DEFAULT_THREAD = 0
+DIGEST_THRESHOLD = 3
+
+PHOTO, VIDEO, TEXT, AUDIO, VOICE, VIDEO_VOICE, POLLS, FILES, STICKER, GIF = (1 << i for i in range(10))
+
+# ключ настройки топика -> бит маски
+SETTING_BITS = {
+    "photo": PHOTO, "video": VIDEO, "text": TEXT,
+    "audio": AUDIO, "voice": VOICE, "video_voice": VIDEO_VOICE,
+    "polls": POLLS, "files": FILES, "sticker": STICKER, "gif": GIF
+}
+
+# тип сообщения -> биты; у анимации Telegram заполняет и document
+CONTENT_BITS = {
+    ContentType.PHOTO: PHOTO, ContentType.VIDEO: VIDEO, ContentType.AUDIO: AUDIO,
+    ContentType.VOICE: VOICE, ContentType.VIDEO_NOTE: VIDEO_VOICE,
+    ContentType.POLL: POLLS, ContentType.DOCUMENT: FILES,
+    ContentType.STICKER: STICKER, ContentType.ANIMATION: GIF | FILES
+}
+
+class TopicRule(NamedTuple):
+    topic_id: str
+    content_mask: int
+    hashtags: FrozenSet[str]
+    allowed_links: DomainIndex
+    content_tracking: bool
+    forward_mentions: bool
+    forward_to: Tuple[Optional[int], ...]
+    flood_limit: int
+    flood_window: float
+    flood_mute: bool
+    duplicate_window: float
+    digest_window: float
+    digest_threshold: int
+
+def normalize_hashtag(tag: str) -> str:
+    tag = tag.strip().lower()
+    return tag if tag.startswith("#") else f"#{tag}"
+
+def thread_key(topic_id: str) -> Optional[int]:
+    if topic_id == "default":
+        return DEFAULT_THREAD
+    try:
+        thread_id = int(topic_id)
+    except ValueError:
+        return None
+    # топик "0" (из /addtopic вне форума) сообщениями не адресуется
+    return thread_id or None
+
+def message_thread(message: Message) -> int:
+    # ответ в General без is_topic_message относится к топику по умолчанию
+    if message.is_topic_message is None and message.reply_to_message is not None:
+        return DEFAULT_THREAD
+    return message.message_thread_id or DEFAULT_THREAD
+
+def compile_topic(topic_id: str, settings: dict) -> TopicRule:
+    mask = 0
+    for key, bit in SETTING_BITS.items():
+        if settings.get(key, key == "text"):
+            mask |= bit
+    return TopicRule(
+        topic_id=topic_id,
+        content_mask=mask,
+        hashtags=frozenset(normalize_hashtag(tag) for tag in settings.get("allowed_hashtags", []) if tag.strip()),
+        allowed_links=DomainIndex(settings.get("allowed_links", [])),
+        content_tracking=bool(settings.get("content_tracking", False)),
+        forward_mentions=bool(settings.get("forward_mentions", False)),
+        forward_to=tuple(None if tid == "default" else int(tid) for tid in settings.get("forward_to_topics", [])),
+        flood_limit=int(settings.get("message_count") or 0),
+        flood_window=float(settings.get("flood_window", 60)),
+        flood_mute=settings.get("flood_action", "delete") == "mute",
+        duplicate_window=float(settings.get("duplicate_window") or 0),
+        digest_window=float(settings.get("digest_window") or 0),
+        digest_threshold=int(settings.get("digest_threshold", DIGEST_THRESHOLD))
+    )
+
+def message_hashtags(message: Message, text: str):
+    entities = message.entities if message.text else message.caption_entities
+    for entity in entities or ():
+        if entity.type == MessageEntityType.HASHTAG:
+            yield entity.extract_from(text).lower()
+
+def is_text_allowed(message: Message, rule: TopicRule) -> bool:
+    text_content = message.text or message.caption
+    if text_content:
+        if rule.content_mask & TEXT: return True
+        if rule.hashtags and any(tag in rule.hashtags for tag in message_hashtags(message, text_content)): return True
+        if rule.allowed_links and any(rule.allowed_links.match(host) for host in message_hosts(message)): return True
+    return False
+
+def is_content_allowed(message: Message, rule: TopicRule) -> bool:
+    if rule.content_mask & CONTENT_BITS.get(message.content_type, 0):
+        return True
+    return is_text_allowed(message, rule)
+
+def is_album_allowed(messages: List[Message], rule: TopicRule) -> bool:
+    # альбом проверяется целиком: подпись обычно только у первой части и разрешает весь альбом
+    if all(rule.content_mask & CONTENT_BITS.get(message.content_type, 0) for message in messages):
+        return True
+    return any(is_text_allowed(message, rule) for message in messages)
+
+class RuleSet:
+    def __init__(self):
+        self._rules: Dict[Tuple[int, int], TopicRule] = {}
+        self._keys: Dict[int, List[Tuple[int, int]]] = {}
+
+    def get(self, chat_id: int, thread_id: int) -> Optional[TopicRule]:
+        return self._rules.get((chat_id, thread_id))
+
+    def rebuild_group(self, group_id: str, group: Optional[dict]):
+        chat_id = int(group_id)
+        compiled = {}
+        for topic_id, settings in (group or {}).get("topics", {}).items():
+            thread_id = thread_key(topic_id)
+            if thread_id is not None:
+                compiled[(chat_id, thread_id)] = compile_topic(topic_id, settings)
+        for key in self._keys.pop(chat_id, ()):
+            if key not in compiled:
+                del self._rules[key]
+        self._rules.update(compiled)
+        if compiled:
+            self._keys[chat_id] = list(compiled)
+
+    def rebuild_topics(self, group_id: str, group: Optional[dict], topic_ids: Set[str]):
+        # пересобрать только перечисленные топики группы, остальные правила не трогаются
+        chat_id = int(group_id)
+        topics = (group or {}).get("topics", {})
+        keys = self._keys.setdefault(chat_id, [])
+        for topic_id in topic_ids:
+            thread_id = thread_key(topic_id)
+            if thread_id is None:
+                continue
+            key = (chat_id, thread_id)
+            if topic_id in topics:
+                self._rules[key] = compile_topic(topic_id, topics[topic_id])
+                if key not in keys:
+                    keys.append(key)
+            elif key in self._rules and self._rules[key].topic_id == topic_id:
+                del self._rules[key]
+                keys.remove(key)
+        if not keys:
+            del self._keys[chat_id]
+
+    def rebuild(self, group_settings: dict):
+        for group_id in set(map(str, self._keys)) - set(group_settings):
+            self.rebuild_group(group_id, None)
+        for group_id, group in group_settings.items():
+            self.rebuild_group(group_id, group)
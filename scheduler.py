@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from collections import deque
+from time import monotonic
+from typing import Any, Awaitable, Callable, Deque, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from metrics import metrics
+
+QUEUE_DEPTH = 200
+IDLE_TIMEOUT = 30.0
+MAX_PENDING = 1000  # апдейтов на входе сразу: остальные ждут у источника, а не в задачах
+
+class ChatScheduler(BaseMiddleware):
+    # очередь на каждый chat.id: внутри чата порядок сохраняется, чаты обрабатываются параллельно
+    def __init__(self, max_depth: int = QUEUE_DEPTH, idle_timeout: float = IDLE_TIMEOUT, max_pending: int = MAX_PENDING):
+        self.max_depth = max_depth
+        self.idle_timeout = idle_timeout
+        self.max_pending = max_pending
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._enqueued: Dict[int, Deque[float]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        metrics.gauge("bot_chat_queue_depth", lambda: {(("chat", chat_id),): queue.qsize()
+                                                      for chat_id, queue in self._queues.items()})
+        metrics.gauge("bot_chat_queue_lag_seconds", lambda: {(("chat", chat_id),): lag
+                                                             for chat_id, lag in self.lag().items()})
+
+    def lag(self) -> Dict[int, float]: #сколько ждёт самый старый апдейт в очереди чата
+        now = monotonic()
+        return {chat_id: now - times[0] for chat_id, times in self._enqueued.items() if times}
+
+    def depth(self) -> Dict[int, int]:
+        return {chat_id: queue.qsize() for chat_id, queue in self._queues.items()}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        chat = data.get("event_chat")
+        if chat is None:
+            return await handler(event, data)
+        queue = self._queues.get(chat.id)
+        if queue is None:
+            queue = self._queues[chat.id] = asyncio.Queue(self.max_depth)
+            self._enqueued[chat.id] = deque()
+        # при переполненной очереди апдейт ждёт здесь — это и есть обратное давление
+        await queue.put((handler, event, data))
+        self._enqueued[chat.id].append(monotonic())
+        if chat.id not in self._workers:
+            self._workers[chat.id] = asyncio.create_task(self._work(chat.id, queue))
+
+    async def _work(self, chat_id: int, queue: asyncio.Queue):
+        times = self._enqueued[chat_id]
+        try:
+            while True:
+                try:
+                    handler, event, data = await asyncio.wait_for(queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if queue.empty():
+                        return
+                    continue
+                if times:
+                    metrics.observe("bot_chat_queue_wait_seconds", monotonic() - times.popleft())
+                try:
+                    await handler(event, data)
+                except Exception as e:
+                    logging.exception(f"Ошибка обработки апдейта в чате {chat_id}: {e}")
+                finally:
+                    queue.task_done()
+        finally:
+            del self._workers[chat_id]
+            if queue.empty():
+                self._queues.pop(chat_id, None)
+                self._enqueued.pop(chat_id, None)
+
+    async def join(self): #дождаться разбора всех очередей, например при остановке
+        for queue in list(self._queues.values()):
+            await queue.join()
@@ -0,0 +1,111 @@
+import asyncio
+import sqlite3
+import threading
+from time import time
+from typing import Dict, Optional, Tuple
+
+SESSION_TTL = 3600.0
+
+class AdminSession:
+    # только id и версия конфига: сами настройки всегда читаются из group_settings
+    __slots__ = ("user_id", "groups", "group", "topic", "version", "touched")
+
+    def __init__(self, user_id: int, groups: Tuple[str, ...] = (), group: Optional[str] = None,
+                 topic: Optional[str] = None, version: int = 0, touched: float = 0.0):
+        self.user_id = user_id
+        self.groups = groups
+        self.group = group
+        self.topic = topic
+        self.version = version
+        self.touched = touched
+
+class SQLiteSessions:
+    # хранилище сессий на диске; другое хранилище должно уметь то же: load, put, expire, close
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (user_id INTEGER PRIMARY KEY, groups TEXT, "
+            "grp TEXT, topic TEXT, version INTEGER, touched REAL)")
+
+    def load(self, user_id: int) -> Optional[AdminSession]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT groups, grp, topic, version, touched FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        groups, group, topic, version, touched = row
+        return AdminSession(user_id, tuple(groups.split(",")) if groups else (), group, topic, version, touched)
+
+    def put(self, session: AdminSession):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, groups, grp, topic, version, touched) VALUES (?, ?, ?, ?, ?, ?)",
+                (session.user_id, ",".join(session.groups), session.group, session.topic,
+                 session.version, session.touched))
+
+    def expire(self, before: float):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE touched < ?", (before,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class SessionStore:
+    # сессии админ-меню по пользователю с вытеснением простаивающих; с backend сессия всегда читается
+    # из него: её мог начать или изменить другой процесс, копия в памяти была бы устаревшей
+    def __init__(self, ttl: float = SESSION_TTL, path: Optional[str] = None):
+        self.ttl = ttl
+        self.backend = SQLiteSessions(path) if path else None
+        self._sessions: Dict[int, AdminSession] = {}
+        self._swept = time()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def _sweep(self, now: float):
+        # полный проход не чаще раза в десятую долю ttl
+        if now - self._swept < self.ttl / 10:
+            return
+        self._swept = now
+        for user_id in [uid for uid, session in self._sessions.items() if now - session.touched >= self.ttl]:
+            del self._sessions[user_id]
+        if self.backend:
+            await asyncio.to_thread(self.backend.expire, now - self.ttl)
+
+    async def get(self, user_id: int) -> Optional[AdminSession]:
+        now = time()
+        await self._sweep(now)
+        if self.backend:
+            session = await asyncio.to_thread(self.backend.load, user_id)
+        else:
+            session = self._sessions.get(user_id)
+        if session is None or now - session.touched >= self.ttl:
+            return None
+        session.touched = now
+        await self.save(session)
+        return session
+
+    async def start(self, user_id: int, groups: Tuple[str, ...], version: int,
+                    group: Optional[str] = None) -> AdminSession:
+        session = AdminSession(user_id, groups, group, None, version, time())
+        if self.backend:
+            await self.save(session)
+        else:
+            self._sessions[user_id] = session
+        return session
+
+    async def update(self, session: AdminSession, **fields):
+        for name, value in fields.items():
+            setattr(session, name, value)
+        await self.save(session)
+
+    async def save(self, session: AdminSession):
+        if self.backend:
+            await asyncio.to_thread(self.backend.put, session)
+
+    async def close(self):
+        if self.backend:
+            self.backend.close()
@@ -0,0 +1,208 @@
+import asyncio
+import copy
+import logging
+import multiprocessing
+import threading
+from typing import Dict, List, Optional
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums.parse_mode import ParseMode
+from aiogram.types import Update
+from catchup import drain_backlog
+from metrics import METRICS_PORT
+from webhook import WEBHOOK_HOST, WEBHOOK_PATH, WEBHOOK_PORT
+
+POLL_TIMEOUT = 30
+POLL_LIMIT = 100
+
+def update_chat_id(update: dict) -> int: #чат апдейта, по нему выбирается шард
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+    return 0
+
+class ShardLink:
+    # канал между входным процессом и воркером; запись в канал не должна останавливать цикл событий
+    def __init__(self, index: int, process: Optional[multiprocessing.Process], conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self._lock = asyncio.Lock()
+
+    async def send(self, message):
+        async with self._lock:
+            await asyncio.to_thread(self.conn.send, message)
+
+def worker_process(index: int, workers: int, conn, config: dict):
+    import logs
+    logs.SHARD = index
+    asyncio.run(_worker(index, workers, conn, config))
+
+async def _worker(index: int, workers: int, conn, config: dict):
+    import handlers
+    import main
+    # общий лимит бота делится между шардами, иначе вместе они шлют в workers раз больше
+    handlers.gateway.split(workers)
+    if config.get("metrics"):
+        metrics_settings = config["metrics"]
+        config = {**config, "metrics": {**metrics_settings, "port": metrics_settings.get("port", METRICS_PORT) + index}}
+    bot, dp = await main.setup(config)
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    # пока апдейты стоят у полных очередей чатов, канал не читается и входной процесс ждёт на записи
+    pending = asyncio.Semaphore(dp["scheduler"].max_pending)
+    parent = ShardLink(index, None, conn)
+
+    def publish(group_id: str, gdata: Optional[dict]):
+        # правки из админ-меню этого воркера уходят во входной процесс и оттуда во все шарды;
+        # снимок берётся сразу, а запись в канал идёт в потоке, не останавливая цикл событий
+        task = asyncio.create_task(parent.send(("config", group_id, copy.deepcopy(gdata))))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    handlers.settings_listeners.append(publish)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        while True:
+            message = await loop.run_in_executor(None, conn.recv)
+            if message[0] == "updates":
+                for update in message[1]:
+                    await pending.acquire()
+                    task = asyncio.create_task(dp.feed_raw_update(bot, update))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    task.add_done_callback(lambda _: pending.release())
+            elif message[0] == "config":
+                handlers.apply_group(message[1], message[2])
+            elif message[0] == "stop":
+                break
+    except EOFError:
+        pass
+    finally:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+
+class ShardRouter:
+    # входной процесс: раздаёт апдейты по hash(chat.id) и пересылает правки конфига всем шардам
+    def __init__(self, config: dict):
+        self.config = config
+        self.workers = config["sharding"].get("workers", multiprocessing.cpu_count())
+        self.links: List[ShardLink] = []
+        if self.workers > 1 and config.get("storage") != "sqlite":
+            # с JSON каждый шард переписывал бы весь файл своей версией и затирал правки соседей
+            raise ValueError("Для нескольких шардов нужно \"storage\": \"sqlite\"")
+        if self.workers > 1 and not config.get("sessions", {}).get("path"):
+            # /botconfig в группе открывает сессию на шарде группы, а меню в ЛС работает на шарде пользователя
+            raise ValueError("Для нескольких шардов нужно общее хранилище сессий: \"sessions\": {\"path\": ...}")
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        loop = asyncio.get_running_loop()
+        for index in range(self.workers):
+            parent, child = context.Pipe()
+            process = context.Process(target=worker_process, args=(index, self.workers, child, self.config), daemon=True)
+            process.start()
+            link = ShardLink(index, process, parent)
+            self.links.append(link)
+            threading.Thread(target=self._listen, args=(link, loop), daemon=True).start()
+
+    def _listen(self, link: ShardLink, loop: asyncio.AbstractEventLoop):
+        while True:
+            try:
+                message = link.conn.recv()
+            except (EOFError, OSError):
+                return
+            if message[0] == "config":
+                asyncio.run_coroutine_threadsafe(self.broadcast(message, exclude=link.index), loop)
+
+    async def broadcast(self, message, exclude: int = -1):
+        await asyncio.gather(*(link.send(message) for link in self.links if link.index != exclude))
+
+    async def dispatch(self, updates: List[dict]):
+        batches: Dict[int, List[dict]] = {}
+        for update in updates:
+            batches.setdefault(update_chat_id(update) % self.workers, []).append(update)
+        await asyncio.gather(*(self.links[index].send(("updates", batch)) for index, batch in batches.items()))
+
+    async def stop(self):
+        await self.broadcast(("stop",))
+        for link in self.links:
+            await asyncio.to_thread(link.process.join, 30)
+
+def _dump(updates: List[Update]) -> List[dict]:
+    return [update.model_dump(mode="json", by_alias=True, exclude_none=True) for update in updates]
+
+async def _catch_up(router: ShardRouter, bot: Bot, allowed_updates: List[str]) -> Optional[int]:
+    if not router.config.get("catchup", True):
+        await bot.delete_webhook(drop_pending_updates=True)
+        return None
+    return await drain_backlog(bot, allowed_updates, lambda updates: router.dispatch(_dump(updates)))
+
+async def _poll(router: ShardRouter, bot: Bot, allowed_updates: List[str]):
+    offset = await _catch_up(router, bot, allowed_updates)
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, limit=POLL_LIMIT, timeout=POLL_TIMEOUT,
+                                            allowed_updates=allowed_updates, request_timeout=POLL_TIMEOUT + 10)
+        except Exception as e:
+            logging.error(f"Ошибка получения апдейтов: {e}")
+            await asyncio.sleep(1)
+            continue
+        if updates:
+            offset = updates[-1].update_id + 1
+            await router.dispatch(_dump(updates))
+
+async def _serve_webhook(router: ShardRouter, bot: Bot, settings: dict, allowed_updates: List[str]):
+    secret = settings.get("secret_token")
+
+    async def handle(request: web.Request) -> web.Response:
+        if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return web.Response(status=401)
+        await router.dispatch([await request.json()])
+        return web.json_response({})
+
+    if settings.get("url"):
+        await _catch_up(router, bot, allowed_updates)
+        catchup = router.config.get("catchup", True)
+        await bot.set_webhook(settings["url"], secret_token=secret, allowed_updates=allowed_updates,
+                              drop_pending_updates=not catchup)
+    app = web.Application()
+    app.router.add_post(settings.get("path", WEBHOOK_PATH), handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, settings.get("host", WEBHOOK_HOST), settings.get("port", WEBHOOK_PORT)).start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+async def run_ingress(config: dict):
+    import handlers
+    dp = Dispatcher()
+    dp.include_router(handlers.router)
+    allowed_updates = dp.resolve_used_update_types()
+    session = AiohttpSession()
+    if config.get("api_server"):
+        session.api = TelegramAPIServer.from_base(config["api_server"])
+    bot = Bot(token=config["api_token"], default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN), session=session)
+    router = ShardRouter(config)
+    router.start()
+    logging.info(f"Запущено шардов: {router.workers}")
+    try:
+        if config.get("webhook"):
+            await _serve_webhook(router, bot, config["webhook"], allowed_updates)
+        else:
+            await _poll(router, bot, allowed_updates)
+    finally:
+        await router.stop()
+        await bot.session.close()
@@ -0,0 +1,209 @@
+import argparse
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+from load_config import ConfigSaver, SAVE_DELAY
+
+FLAG_COLUMNS = (
+    "photo", "video", "text", "audio", "voice", "video_voice", "polls", "files",
+    "sticker", "gif", "content_tracking", "is_general", "forward_mentions"
+)
+LIST_TABLES = {
+    "allowed_hashtags": ("topic_hashtags", "hashtag"),
+    "allowed_links": ("topic_domains", "domain"),
+    "forward_to_topics": ("topic_forwards", "target_id")
+}
+TOPIC_COLUMNS = ("name",) + FLAG_COLUMNS + ("message_count",)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS groups (
+    chat_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS topics (
+    chat_id INTEGER NOT NULL REFERENCES groups(chat_id) ON DELETE CASCADE,
+    topic_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    {", ".join(f"{column} INTEGER" for column in FLAG_COLUMNS)},
+    message_count INTEGER,
+    extra TEXT,
+    PRIMARY KEY (chat_id, topic_id)
+);
+{"".join(f'''
+CREATE TABLE IF NOT EXISTS {table} (
+    chat_id INTEGER NOT NULL,
+    topic_id TEXT NOT NULL,
+    {column} TEXT NOT NULL,
+    PRIMARY KEY (chat_id, topic_id, {column}),
+    FOREIGN KEY (chat_id, topic_id) REFERENCES topics(chat_id, topic_id) ON DELETE CASCADE
+);''' for table, column in LIST_TABLES.values())}
+CREATE TABLE IF NOT EXISTS group_admins (
+    chat_id INTEGER NOT NULL REFERENCES groups(chat_id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS group_admins_user ON group_admins(user_id);
+"""
+
+class SQLiteStore:
+    # настройки групп построчно: одна правка — один upsert одной строки топика
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def load_group(self, chat_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT name FROM groups WHERE chat_id = ?", (chat_id,)).fetchone()
+            if row is None:
+                return None
+            group = {"name": row[0], "topics": {}}
+            cursor = self._db.execute(
+                f"SELECT topic_id, {', '.join(TOPIC_COLUMNS)}, extra FROM topics WHERE chat_id = ? ORDER BY rowid",
+                (chat_id,))
+            for topic_id, *values, extra in cursor:
+                topic = json.loads(extra) if extra else {}
+                for column, value in zip(TOPIC_COLUMNS, values):
+                    if value is not None:
+                        topic[column] = bool(value) if column in FLAG_COLUMNS else value
+                group["topics"][topic_id] = topic
+            for key, (table, column) in LIST_TABLES.items():
+                cursor = self._db.execute(
+                    f"SELECT topic_id, {column} FROM {table} WHERE chat_id = ? ORDER BY rowid", (chat_id,))
+                for topic_id, value in cursor:
+                    group["topics"][topic_id].setdefault(key, []).append(value)
+            admins = [user_id for user_id, in self._db.execute(
+                "SELECT user_id FROM group_admins WHERE chat_id = ?", (chat_id,))]
+            if admins:
+                group["admins"] = admins
+            return group
+
+    def data_version(self) -> int:
+        # растёт, когда базу меняет другое соединение: другой шард или ручная правка
+        with self._lock:
+            return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def admin_group_ids(self, user_id: int) -> List[int]:
+        # группы, где пользователь в копии списка админов, и группы без списка
+        with self._lock:
+            return [chat_id for chat_id, in self._db.execute(
+                "SELECT chat_id FROM group_admins WHERE user_id = ? "
+                "UNION SELECT chat_id FROM groups WHERE chat_id NOT IN (SELECT chat_id FROM group_admins)",
+                (user_id,))]
+
+    def _upsert_group(self, chat_id: int, group: dict, with_admins: bool):
+        self._db.execute(
+            "INSERT INTO groups (chat_id, name) VALUES (?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET name = excluded.name",
+            (chat_id, group.get("name", str(chat_id))))
+        if with_admins and "admins" in group:
+            self._db.execute("DELETE FROM group_admins WHERE chat_id = ?", (chat_id,))
+            self._db.executemany(
+                "INSERT OR IGNORE INTO group_admins (chat_id, user_id) VALUES (?, ?)",
+                [(chat_id, user_id) for user_id in group["admins"]])
+
+    def _upsert_topic(self, chat_id: int, topic_id: str, topic: dict):
+        values = [topic.get("name", topic_id)]
+        values += [None if topic.get(column) is None else int(bool(topic[column])) for column in FLAG_COLUMNS]
+        values.append(topic.get("message_count"))
+        extra = {key: value for key, value in topic.items() if key not in TOPIC_COLUMNS and key not in LIST_TABLES}
+        self._db.execute(
+            f"INSERT INTO topics (chat_id, topic_id, {', '.join(TOPIC_COLUMNS)}, extra) "
+            f"VALUES (?, ?, {', '.join('?' * len(TOPIC_COLUMNS))}, ?) "
+            f"ON CONFLICT(chat_id, topic_id) DO UPDATE SET "
+            f"{', '.join(f'{column} = excluded.{column}' for column in TOPIC_COLUMNS)}, extra = excluded.extra",
+            (chat_id, topic_id, *values, json.dumps(extra, ensure_ascii=False) if extra else None))
+        for key, (table, column) in LIST_TABLES.items():
+            self._db.execute(f"DELETE FROM {table} WHERE chat_id = ? AND topic_id = ?", (chat_id, topic_id))
+            self._db.executemany(
+                f"INSERT OR IGNORE INTO {table} (chat_id, topic_id, {column}) VALUES (?, ?, ?)",
+                [(chat_id, topic_id, str(value)) for value in topic.get(key, [])])
+
+    def apply(self, changes: List[Tuple[int, Optional[str], Optional[dict]]]):
+        # changes: (chat_id, None, группа) — строка группы и админы;
+        # (chat_id, topic_id, топик или None) — upsert или удаление топика
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for chat_id, topic_id, data in changes:
+                    if topic_id is None:
+                        if data is not None:
+                            self._upsert_group(chat_id, data, with_admins=True)
+                    elif data is None:
+                        self._db.execute("DELETE FROM topics WHERE chat_id = ? AND topic_id = ?", (chat_id, topic_id))
+                    else:
+                        self._upsert_topic(chat_id, topic_id, data)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def import_config(self, config: dict) -> int: #перенос group_settings из bot_data.json
+        changes = []
+        for group_id, group in config.get("group_settings", {}).items():
+            changes.append((int(group_id), None, group))
+            for topic_id, topic in group.get("topics", {}).items():
+                changes.append((int(group_id), topic_id, topic))
+        self.apply(changes)
+        return len(config.get("group_settings", {}))
+
+class StoreSaver(ConfigSaver):
+    # отложенная запись изменённых строк в SQLite вместо перезаписи всего конфига
+    def __init__(self, store: SQLiteStore, group_settings: dict, delay: float = SAVE_DELAY):
+        super().__init__(lambda: group_settings, delay, store.path)
+        self.store = store
+        self._keys = set()
+
+    def mark_dirty(self, group_id: Optional[str] = None, topic_id: Optional[str] = None):
+        if group_id is not None:
+            self._keys.add((group_id, topic_id))
+        super().mark_dirty()
+
+    def _snapshot(self, keys) -> List[Tuple[int, Optional[str], Optional[dict]]]:
+        group_settings = self.get_config()
+        changes = []
+        for group_id, topic_id in keys:
+            group = group_settings.get(group_id)
+            if topic_id is None:
+                data = None if group is None else {"name": group.get("name", group_id), "admins": list(group.get("admins", []))}
+            else:
+                topic = (group or {}).get("topics", {}).get(topic_id)
+                data = None if topic is None else {key: list(value) if isinstance(value, list) else value
+                                                   for key, value in topic.items()}
+                if group is not None:
+                    changes.append((int(group_id), None, {"name": group.get("name", group_id)}))
+            changes.append((int(group_id), topic_id, data))
+        return changes
+
+    async def _write(self):
+        keys, self._keys = self._keys, set()
+        self._dirty = False
+        try:
+            await asyncio.to_thread(self.store.apply, self._snapshot(keys))
+        except Exception as e:
+            logging.error(f"Ошибка сохранения настроек: {e}")
+            self._keys |= keys
+            self._dirty = True
+            await asyncio.sleep(self.delay)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перенос настроек из bot_data.json в SQLite")
+    parser.add_argument("source", help="путь к bot_data.json")
+    parser.add_argument("database", help="путь к файлу SQLite")
+    args = parser.parse_args()
+    with open(args.source, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    store = SQLiteStore(args.database)
+    print(f"Импортировано групп: {store.import_config(config)}")
+    store.close()
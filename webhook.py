@@ -0,0 +1,49 @@
+import asyncio
+import logging
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from catchup import drain_backlog, feed_updates
+
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_HOST = "127.0.0.1"
+WEBHOOK_PORT = 8080
+
+def build_app(dp: Dispatcher, bot: Bot, settings: dict) -> web.Application:
+    # апдейт подтверждается, как только встал в очередь чата; при полной очереди ответ ждёт,
+    # и Telegram не шлёт больше max_connections апдейтов сразу — задачи не копятся без предела
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=settings.get("secret_token"),
+        handle_in_background=False
+    ).register(app, path=settings.get("path", WEBHOOK_PATH))
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook(dp: Dispatcher, bot: Bot, settings: dict, catchup: bool = False):
+    # без "url" вебхук в Telegram не регистрируется: удобно слать записанные апдейты вручную
+    url = settings.get("url")
+    if url:
+        allowed_updates = dp.resolve_used_update_types()
+        if catchup:
+            # пока вебхук снят, накопившееся забирается через getUpdates
+            await drain_backlog(bot, allowed_updates, lambda updates: feed_updates(dp, bot, updates),
+                                settle=dp["scheduler"].join if "scheduler" in dp.workflow_data else None)
+        await bot.set_webhook(
+            url,
+            secret_token=settings.get("secret_token"),
+            allowed_updates=allowed_updates,
+            drop_pending_updates=not catchup,
+            max_connections=settings.get("max_connections")
+        )
+    runner = web.AppRunner(build_app(dp, bot, settings))
+    await runner.setup()
+    host, port = settings.get("host", WEBHOOK_HOST), settings.get("port", WEBHOOK_PORT)
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Вебхук слушает {host}:{port}{settings.get('path', WEBHOOK_PATH)}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()